@@ -20,14 +20,24 @@ import os                          # ファイル操作に使う
 import sys                         # プログラムの終了などに使う
 import time                        # 時間を扱う（待機など）
 import signal                      # Ctrl+Cを検知するために使う
+import queue                       # 処理待ちのファイルを順番に並べる
+import threading                   # 文字起こしを別スレッドで動かす
+from collections import OrderedDict  # 追加した順番を覚えている辞書
 import argparse                    # コマンドライン引数を扱う
+import subprocess                  # 外部コマンド（mount）を実行する
 from pathlib import Path           # ファイルパスを扱いやすくする
 from datetime import datetime      # 日付と時刻を扱う
 from watchdog.observers import Observer          # フォルダを監視する機能
+from watchdog.observers.polling import PollingObserver  # 定期的に見に行って監視する機能（予備）
 from watchdog.events import FileSystemEventHandler  # ファイルの変更を検知する機能
 
 # 文字起こし機能を別のファイル（transcribe.py）から読み込む
-from transcribe import transcribe_audio, save_transcription, setup_directories
+from transcribe import (
+    transcribe_audio, save_transcription, open_transcription_file, setup_directories,
+    get_m4a_files,
+    get_whisper_model, pick_device, DEFAULT_BATCH_SIZE, INFERENCE_SLOTS,
+    audio_fingerprint, ResultCache,
+)
 
 
 # ============================================================
@@ -37,6 +47,23 @@ from transcribe import transcribe_audio, save_transcription, setup_directories
 INPUT_DIR = "input"       # 監視するフォルダ（ここに音声ファイルを入れる）
 OUTPUT_DIR = "output"     # 結果を保存するフォルダ
 
+# ファイルの書き込み完了（on_closed）を検知できるかどうか
+# Linux の inotify は知らせてくれるが、macOS の FSEvents は知らせてくれない
+SUPPORTS_CLOSE_EVENT = sys.platform.startswith("linux")
+
+# ネットワーク上のフォルダ（NAS・共有フォルダなど）の種類
+# これらはOSが変更を知らせてくれないので、定期的に見に行く方法（ポーリング）で監視する
+NETWORK_FS_TYPES = {
+    "nfs", "nfs4", "cifs", "smb3", "smbfs", "afpfs", "webdav",
+    "sshfs", "fuse.sshfs", "9p",
+}
+
+# 処理が終わったファイルを何個まで覚えておくか（古いものから忘れる）
+DONE_CACHE_SIZE = 256
+
+# ポーリングするときに何秒ごとにフォルダを見に行くか（環境変数 WATCH_INTERVAL で変更可）
+DEFAULT_POLL_INTERVAL = int(os.getenv("WATCH_INTERVAL", "30"))
+
 
 # ============================================================
 # フォルダ監視のためのクラス（設計図）
@@ -51,18 +78,55 @@ class AudioFileHandler(FileSystemEventHandler):
     このクラスは「新しいファイルが追加されたら文字起こしする」というレシピ。
     """
 
-    def __init__(self, model_name="base", language="ja"):
+    def __init__(self, model_name="base", language="ja", batch_size=DEFAULT_BATCH_SIZE,
+                 compute_type=None, close_events=SUPPORTS_CLOSE_EVENT):
         """
         初期設定（このクラスを使い始めるときに最初に実行される）
 
         引数（材料）:
             model_name: Whisperのモデル名（精度と速度のバランス）
             language: 言語（日本語は "ja"）
+            batch_size: 一度にまとめて計算する区間の数
+            compute_type: モデルの数値の精度（None なら自動）
+            close_events: 書き込み完了（on_closed）が届くかどうか
+                          （ポーリングで監視するときは届かないので False）
         """
         super().__init__()  # 親クラスの初期化（おまじない）
         self.model_name = model_name    # モデル名を保存
         self.language = language        # 言語を保存
-        self.processing_files = set()   # 現在処理中のファイルを記録（重複防止）
+        self.batch_size = batch_size    # まとめて計算する区間の数を保存
+        self.close_events = close_events  # on_closed が届くかどうかを保存
+        self.processing_files: set[str] = set()  # 処理待ち・処理中のファイルを記録（重複防止）
+        self.closed_files: set[str] = set()      # 処理待ちの間に on_closed が届いたファイル
+        self.lock = threading.Lock()    # processing_files などを複数スレッドから安全に使うための鍵
+
+        # 最近処理が終わったファイルを記録（終わった後の名前変更などで再処理しないため）
+        # {ファイルの絶対パス: (更新日時, サイズ)}
+        self.done_cache = OrderedDict()
+
+        # Whisperモデルを最初に1回だけ読み込んで、全ファイルで使い回す
+        device = pick_device()
+        self.model = get_whisper_model(model_name, device, compute_type)
+
+        # 同じ音声の文字起こし結果を覚えておくキャッシュ（前回の分も読み込む）
+        # transcribe_auto.py と同じファイル（output/.cache.json）を使う
+        self.result_cache = ResultCache(model_name, language, device, compute_type)
+
+        # 処理待ちのファイルを並べる列（キュー）
+        # 監視係（watchdog）はここに入れるだけで、すぐ次の監視に戻れる
+        self.job_queue = queue.Queue(maxsize=64)
+
+        # キューからファイルを取り出して文字起こしする係（ワーカースレッド）
+        # GPUは1つのファイルだけでは計算に余裕があるので、同じモデルを使って
+        # モデルが同時に計算できる数（INFERENCE_SLOTS）だけファイルを並行して処理する
+        # （モデルは共有なので、係を増やしてもメモリはほとんど増えない）
+        # daemon=True → プログラム終了時に一緒に終わる
+        self.workers = [
+            threading.Thread(target=self._worker, daemon=True)
+            for _ in range(INFERENCE_SLOTS.get(device, 1))
+        ]
+        for worker in self.workers:
+            worker.start()
 
         print("=" * 70)
         print("📁 フォルダ監視プログラムが起動しました！")
@@ -81,6 +145,30 @@ class AudioFileHandler(FileSystemEventHandler):
         print("=" * 70)
         print()
 
+        # 起動する前から input/ に入っていたファイルも処理する
+        self._enqueue_existing_files()
+
+    def _enqueue_existing_files(self):
+        """
+        起動時に input/ フォルダにすでにあるファイルを処理待ちキューに入れる関数
+
+        【なぜ必要？】
+        watchdog は「起動した後に」追加されたファイルしか知らせてくれない。
+        起動前に入れておいたファイルは、ここで見つけて処理する。
+        ただし、前に同じ設定（モデル・言語・精度）で文字起こしした音声は飛ばす。
+        """
+        for file_path in get_m4a_files():
+            try:
+                if self.result_cache.has(audio_fingerprint(file_path)):
+                    print(f"⏭️  文字起こし済みなので飛ばします: {file_path.name}")
+                    continue
+            except OSError:
+                continue  # 読めないファイルは飛ばす
+
+            print(f"🔍 処理していないファイルを発見: {file_path.name}")
+            # processing_files に登録されるので、後から on_created が来ても二重に処理しない
+            self._maybe_process(file_path, wait=False)
+
     def on_created(self, event):
         """
         新しいファイルが作成されたときに自動的に呼ばれる関数
@@ -89,6 +177,11 @@ class AudioFileHandler(FileSystemEventHandler):
         「何かが起きたとき」のこと。この関数は「ファイルが作られたとき」に
         自動的に実行される。
 
+        【注意】
+        ファイルが「作られた」瞬間は、まだ中身を書き込んでいる途中のことが多い。
+        Linuxでは書き込みが終わったときに on_closed が呼ばれるので、
+        ここでは検出したことを表示するだけにする。
+
         引数:
             event: 何が起きたかの情報（ファイル名など）
         """
@@ -105,75 +198,260 @@ class AudioFileHandler(FileSystemEventHandler):
         if file_path.suffix.lower() != ".m4a":
             return  # .m4aでなければ何もしない
 
-        # すでに処理中のファイルは無視する（二重処理を防ぐ）
-        if str(file_path) in self.processing_files:
+        print(f"🔍 新しいファイルを検出: {file_path.name}")
+
+        # 書き込み完了（on_closed）を待てる場合はここでは何もしない
+        # ただし、別フォルダから移動してきたファイルは最初から中身があり、
+        # on_closed が来ないので、サイズ確認の方法で処理する
+        if self.close_events and self._get_file_size(file_path) == 0:
+            print("   ファイルの書き込みが完了するまで待機中...")
             return
 
-        # ファイルが完全にコピーされるまで少し待つ
-        # （大きなファイルはコピーに時間がかかるため）
-        print(f"🔍 新しいファイルを検出: {file_path.name}")
-        print("   ファイルのコピーが完了するまで待機中...")
-        time.sleep(2)  # 2秒待つ
+        # on_closed が使えない環境（macOSなど）では、サイズ確認で完了を待つ
+        self._maybe_process(file_path, wait=True)
+
+    def on_closed(self, event):
+        """
+        ファイルの書き込みが終わって閉じられたときに自動的に呼ばれる関数
+
+        【なぜ便利？】
+        「閉じられた」＝「コピーが終わった」なので、待たずにすぐ処理を始められる。
+        （Linux の inotify が知らせてくれる。macOS では呼ばれない）
+
+        引数:
+            event: 何が起きたかの情報（ファイル名など）
+        """
+
+        # フォルダは無視する
+        if event.is_directory:
+            return
+
+        # 書き込みが終わっているので、待たずに処理する
+        self._maybe_process(Path(event.src_path), wait=False)
+
+    def _maybe_process(self, file_path, wait):
+        """
+        処理すべきファイルなら処理待ちキューに入れる関数
+
+        【なぜキューに入れるだけ？】
+        文字起こしには何分もかかる。ここで文字起こしをすると、その間
+        監視係が止まってしまい、次に追加されたファイルを見逃すことがある。
+
+        引数:
+            file_path: 音声ファイルのパス
+            wait: True ならファイルのコピー完了をサイズ確認で待つ
+        """
 
-        # ファイルが完全にコピーされたか確認
-        if not self._wait_for_file_ready(file_path):
-            print(f"⚠️  ファイルの準備ができませんでした: {file_path.name}")
+        # .m4aファイルでなければ何もしない
+        if file_path.suffix.lower() != ".m4a":
             return
 
-        # 文字起こしを開始
-        self._process_audio_file(file_path)
+        # 同じファイルでも "./input/a.m4a" と "input/a.m4a" のように
+        # 書き方が違うことがあるので、絶対パスにそろえてから比べる
+        key = self._file_key(file_path)
+
+        # すでに処理待ち・処理中・処理済みのファイルは無視する（二重処理を防ぐ）
+        with self.lock:
+            if key in self.processing_files:
+                # サイズ確認で待っている途中に on_closed が届いたら、
+                # 「書き込み完了」を記録して、待つのをやめてもらう
+                if not wait:
+                    self.closed_files.add(key)
+                return
+            if key in self.done_cache and self.done_cache[key] == self._file_signature(file_path):
+                return
+            self.processing_files.add(key)
+
+        # キューに追加（ワーカースレッドが順番に処理する）
+        self.job_queue.put((file_path, wait))
+
+    def _worker(self):
+        """
+        キューからファイルを取り出して、1つずつ文字起こしする関数
+        （ワーカースレッドでずっと動き続ける）
+        """
+        while True:
+            # 次のファイルが来るまで待つ
+            job = self.job_queue.get()
+
+            # None は「終了の合図」
+            if job is None:
+                return
+            self._run_job(job)
+
+    def _run_job(self, job):
+        """
+        キューから取り出した1つのファイルを処理する関数
+
+        引数:
+            job: (ファイルのパス, コピー完了を待つかどうか) の組
+        """
+        file_path, wait = job
+        key = self._file_key(file_path)
+        retry = False  # あとでもう一度確認するかどうか
+
+        try:
+            # ファイルが完全にコピーされたか確認
+            try:
+                ready = not wait or self._wait_for_file_ready(file_path, key=key)
+            except OSError as e:
+                print(f"⚠️  ファイルを確認できませんでした: {file_path.name}（{e}）")
+                return
+
+            if not ready:
+                # まだコピー中なら、捨てずにキューの最後に並び直す
+                # （この後に届くイベントがないので、ここで捨てると二度と処理されない）
+                if file_path.exists():
+                    print(f"⏳ まだコピー中のようです。あとでもう一度確認します: {file_path.name}")
+                    retry = True
+                else:
+                    print(f"⚠️  ファイルの準備ができませんでした: {file_path.name}")
+                return
+
+            # 文字起こしを開始（成功したら処理済みとして記録）
+            if self._process_audio_file(file_path):
+                self._mark_done(key, file_path)
+
+        finally:
+            # 処理が終わったら処理中リストから削除
+            # （finally は、エラーが起きても必ず実行される）
+            # 並び直すときは、処理待ちのままにしておく（二重に並ばないように）
+            with self.lock:
+                if not retry:
+                    self.processing_files.discard(key)
+                    self.closed_files.discard(key)
+
+        if retry:
+            try:
+                self.job_queue.put_nowait((file_path, True))
+            except queue.Full:
+                # キューがいっぱいなら諦める（自分のキューで待つと止まってしまうため）
+                print(f"⚠️  処理待ちがいっぱいのため、スキップします: {file_path.name}")
+                with self.lock:
+                    self.processing_files.discard(key)
+                    self.closed_files.discard(key)
+
+    def _file_key(self, file_path):
+        """
+        ファイルを見分けるための名前（絶対パスの文字列）を作る関数
+        """
+        return str(Path(file_path).resolve())
+
+    def _file_signature(self, file_path):
+        """
+        ファイルの中身が変わったか見分けるための情報（更新日時, サイズ）を返す関数
+        （ファイルがなければ None）
+        """
+        try:
+            st = file_path.stat()
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _mark_done(self, key, file_path):
+        """
+        処理が終わったファイルを記録する関数
 
-    def _wait_for_file_ready(self, file_path, max_wait=30):
+        同じファイルがもう一度届いても、中身が変わっていなければ処理しない。
+        記録は DONE_CACHE_SIZE 個まで。あふれたら一番古いものから忘れる。
+        """
+        signature = self._file_signature(file_path)
+        if signature is None:
+            return
+
+        with self.lock:
+            self.done_cache[key] = signature
+            self.done_cache.move_to_end(key)  # 一番新しい場所へ
+            while len(self.done_cache) > DONE_CACHE_SIZE:
+                self.done_cache.popitem(last=False)  # 一番古いものを忘れる
+
+    def _get_file_size(self, file_path):
+        """
+        ファイルサイズを取得する関数（取得できなければ -1 を返す）
+        """
+        try:
+            return file_path.stat().st_size
+        except OSError:
+            return -1
+
+    def _wait_for_file_ready(self, file_path, max_wait=30, interval=1.0, initial_backoff=0.25,
+                             key=None):
         """
         ファイルが完全にコピーされるまで待つ関数
 
         【なぜ必要？】
         大きなファイルは、inputフォルダにコピーするのに時間がかかる。
         コピー中に文字起こしを始めると失敗するので、完全にコピーされるまで待つ。
+        （on_closed が使えない環境のための予備の方法）
 
         引数:
             file_path: チェックするファイルのパス
             max_wait: 最大で何秒待つか（デフォルト30秒）
+            interval: 何秒ごとにサイズを確認するか（デフォルト1秒）
+            initial_backoff: ファイルが開けないとき、最初に何秒待つか（デフォルト0.25秒）
+                             失敗が続くたびに2倍にする（0.25 → 0.5 → 1 → 2秒）
+            key: ファイルの名前（_file_key()）。待っている間に on_closed が届いたら
+                 その時点で完了とする
 
         戻り値:
             True: ファイルの準備ができた
             False: タイムアウト（時間切れ）
+
+        エラー:
+            ファイルがない・使用中（PermissionError）以外のエラーはそのまま伝える
         """
         start_time = time.time()  # 開始時刻を記録
         last_size = -1            # 前回のファイルサイズ（最初は-1）
         stable_count = 0          # ファイルサイズが変わらなかった回数
+        fd = None                 # 開いたファイルの番号（ファイルディスクリプタ）
+        backoff = initial_backoff # ファイルが開けないときに待つ秒数
 
-        while True:
-            # 時間切れチェック
-            if time.time() - start_time > max_wait:
-                return False  # 30秒経っても準備できなかったら諦める
-
-            # ファイルが存在するかチェック
-            if not file_path.exists():
-                time.sleep(0.5)  # 0.5秒待って再チェック
-                continue
-
-            try:
-                # 現在のファイルサイズを取得
-                current_size = file_path.stat().st_size
-
-                # ファイルサイズが変わっていないかチェック
-                if current_size == last_size:
-                    stable_count += 1  # 変わっていない → カウントアップ
-                    # 3回連続で同じサイズなら、コピー完了と判断
-                    if stable_count >= 3:
-                        return True
-                else:
-                    # サイズが変わった → まだコピー中
-                    stable_count = 0
-                    last_size = current_size
-
-                time.sleep(0.5)  # 0.5秒待って再チェック
+        # ファイルを1回だけ開いて、開いたままサイズを確認する（os.fstat）
+        # パスからサイズを調べる（stat）と毎回フォルダをたどり直すので、
+        # ネットワーク上のフォルダでは特に遅くなる
+        try:
+            while True:
+                # 待っている間に on_closed が届いたら、書き込みは終わっている
+                if key is not None and key in self.closed_files:
+                    return True
+
+                # 時間切れチェック
+                if time.time() - start_time > max_wait:
+                    return False  # 30秒経っても準備できなかった
+
+                try:
+                    # まだ開いていなければ開く（ファイルがなければエラー）
+                    if fd is None:
+                        fd = os.open(str(file_path), os.O_RDONLY)
+
+                    # 現在のファイルサイズを取得
+                    current_size = os.fstat(fd).st_size
+                    backoff = initial_backoff  # 開けたので待ち時間を元に戻す
+
+                    # ファイルサイズが変わっていないかチェック
+                    if current_size == last_size:
+                        stable_count += 1  # 変わっていない → カウントアップ
+                        # 2回連続で同じサイズなら、コピー完了と判断
+                        if stable_count >= 2:
+                            return True
+                    else:
+                        # サイズが変わった → まだコピー中
+                        stable_count = 0
+                        last_size = current_size
+
+                    time.sleep(interval)  # 少し待って再チェック
+
+                except (PermissionError, FileNotFoundError):
+                    # まだファイルがない・コピー中で開けない（Windows）ときは、
+                    # 待ち時間を少しずつ長くしながら再チェック（最大2秒）
+                    time.sleep(backoff)
+                    backoff = min(backoff * 2, 2.0)
+                    continue
 
-            except Exception as e:
-                # エラーが起きたら0.5秒待って再チェック
-                time.sleep(0.5)
-                continue
+        finally:
+            # 開いたファイルは必ず閉じる
+            if fd is not None:
+                os.close(fd)
 
     def _process_audio_file(self, file_path):
         """
@@ -181,25 +459,41 @@ class AudioFileHandler(FileSystemEventHandler):
 
         引数:
             file_path: 文字起こしする音声ファイルのパス
-        """
-        # 処理中リストに追加（二重処理を防ぐ）
-        self.processing_files.add(str(file_path))
 
+        戻り値:
+            True: 成功した
+            False: エラーが起きた
+        """
         try:
             print()
             print("🎤 文字起こしを開始します")
             print(f"📄 ファイル: {file_path.name}")
             print()
 
-            # transcribe.pyの関数を使って文字起こし実行
-            transcription = transcribe_audio(
-                file_path,
-                model_name=self.model_name,
-                language=self.language
-            )
-
-            # 結果をテキストファイルに保存
-            output_path = save_transcription(transcription, file_path.name)
+            # 前に同じ音声を文字起こししていたら、その結果を使い回す
+            # （同じ音声でも、モデル・言語・精度が違えば文字起こしし直す）
+            fingerprint = audio_fingerprint(file_path)
+            transcription = self.result_cache.lookup(fingerprint)
+
+            if transcription is not None:
+                print("♻️  同じ音声の文字起こし結果が見つかったので、それを使います")
+
+                # 結果をテキストファイルに保存
+                output_path = save_transcription(transcription, file_path.name)
+            else:
+                # transcribe.pyの関数を使って文字起こし実行
+                # （結果は区間ごとにファイルへ書き込まれる）
+                with open_transcription_file(file_path.name) as f:
+                    output_path = transcribe_audio(
+                        file_path,
+                        model=self.model,
+                        language=self.language,
+                        batch_size=self.batch_size,
+                        output_file=f
+                    )
+
+            # 次に同じ音声が来たときのために、キャッシュに記録
+            self.result_cache.store(fingerprint, output_path)
 
             print()
             print("✅ 文字起こしが完了しました！")
@@ -207,6 +501,7 @@ class AudioFileHandler(FileSystemEventHandler):
             print()
             print("👀 次のファイルを待っています...")
             print()
+            return True
 
         except Exception as e:
             # エラーが起きたときの処理
@@ -216,19 +511,91 @@ class AudioFileHandler(FileSystemEventHandler):
             print()
             print("👀 次のファイルを待っています...")
             print()
+            return False
 
-        finally:
-            # 処理が終わったら処理中リストから削除
-            # （finally は、エラーが起きても必ず実行される）
-            self.processing_files.discard(str(file_path))
+
+# ============================================================
+# オブザーバー（フォルダを監視する係）を作るための処理
+# ============================================================
+
+def _get_fs_type(path):
+    """
+    フォルダがどの種類のファイルシステム上にあるか調べる関数
+
+    引数:
+        path: 調べるフォルダのパス
+
+    戻り値:
+        ファイルシステムの種類（例: "ext4", "apfs", "smbfs"）
+        分からなければ None
+    """
+    path = os.path.realpath(path)
+
+    # マウント情報を「マウント先, 種類」の組で集める
+    mounts = []
+    try:
+        if os.path.exists("/proc/mounts"):
+            # Linux: /proc/mounts の各行は「デバイス マウント先 種類 ...」
+            with open("/proc/mounts", encoding="utf-8") as f:
+                for line in f:
+                    fields = line.split()
+                    if len(fields) >= 3:
+                        mounts.append((fields[1], fields[2]))
+        else:
+            # macOS: mount コマンドの各行は「デバイス on マウント先 (種類, ...)」
+            output = subprocess.run(
+                ["mount"], capture_output=True, text=True, check=True
+            ).stdout
+            for line in output.splitlines():
+                if " on " in line and " (" in line:
+                    rest = line.split(" on ", 1)[1]
+                    mount_point, options = rest.rsplit(" (", 1)
+                    mounts.append((mount_point, options.split(",")[0].strip(" )")))
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+    # 一番長く一致するマウント先が、そのフォルダが乗っているファイルシステム
+    best_point, best_type = "", None
+    for mount_point, fs_type in mounts:
+        inside = path == mount_point or path.startswith(mount_point.rstrip("/") + "/")
+        if inside and len(mount_point) > len(best_point):
+            best_point, best_type = mount_point, fs_type
+    return best_type
+
+
+def _make_observer(path, poll_interval=DEFAULT_POLL_INTERVAL):
+    """
+    フォルダに合ったオブザーバー（監視する係）を作る関数
+
+    【なぜ使い分けるの？】
+    普通のフォルダなら、OSが変更をすぐに知らせてくれる（inotify / FSEvents）ので
+    CPUをほとんど使わない。ネットワーク上のフォルダではOSが知らせてくれないので、
+    定期的にフォルダの中身を全部確認しに行く必要がある（ポーリング）。
+    確認の間隔が短いほどCPUを使うので、間隔は長め（デフォルト30秒）にする。
+
+    引数:
+        path: 監視するフォルダのパス
+        poll_interval: ポーリングするときに何秒ごとに見に行くか
+
+    戻り値:
+        (オブザーバー, ポーリングで監視するかどうか) の組
+    """
+    fs_type = _get_fs_type(path)
+
+    if fs_type in NETWORK_FS_TYPES:
+        print(f"📡 ネットワーク上のフォルダ（{fs_type}）なので、{poll_interval}秒ごとに確認します")
+        return PollingObserver(timeout=poll_interval), True
+
+    return Observer(), False
 
 
 # ============================================================
 # プログラムを終了するための処理
 # ============================================================
 
-# プログラムを綺麗に終了させるための変数
-should_exit = False
+# プログラムを綺麗に終了させるための合図（イベント）
+# set() されるまで wait() で眠って待つので、待っている間CPUを使わない
+_exit_event = threading.Event()
 
 def signal_handler(sig, frame):
     """
@@ -242,8 +609,6 @@ def signal_handler(sig, frame):
         sig: シグナルの種類
         frame: 現在のプログラムの状態（使わない）
     """
-    global should_exit  # グローバル変数（プログラム全体で使える変数）
-
     print()
     print()
     print("=" * 70)
@@ -252,7 +617,7 @@ def signal_handler(sig, frame):
     print("プログラムを終了しています...")
     print()
 
-    should_exit = True  # 終了フラグを立てる
+    _exit_event.set()  # 終了の合図を出す（wait() している main が目を覚ます）
 
 
 # ============================================================
@@ -298,6 +663,38 @@ def main():
              "など"
     )
 
+    # --compute-type オプション（モデルの数値の精度）
+    parser.add_argument(
+        "--compute-type",
+        type=str,
+        default=None,
+        choices=["int8", "int8_float16", "float16", "float32"],
+        help="モデルの数値の精度 (デフォルト: CPUはint8、GPUはint8_float16)\n"
+             "int8: 一番速くて省メモリ\n"
+             "float16: GPU向け、int8よりわずかに高精度\n"
+             "float32: 一番正確だけど遅い"
+    )
+
+    # --batch-size オプション（一度にまとめて計算する区間の数）
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=DEFAULT_BATCH_SIZE,
+        help=f"一度にまとめて計算する区間の数 (デフォルト: {DEFAULT_BATCH_SIZE})\n"
+             "大きいほど速いけど、GPUのメモリを多く使います"
+    )
+
+    # --poll-interval オプション（ネットワーク上のフォルダを確認する間隔）
+    parser.add_argument(
+        "--poll-interval",
+        type=int,
+        default=DEFAULT_POLL_INTERVAL,
+        help=f"ネットワーク上のフォルダを何秒ごとに確認するか (デフォルト: {DEFAULT_POLL_INTERVAL})\n"
+             "普通のフォルダではOSが変更を知らせてくれるので使いません\n"
+             "小さくするとファイルに早く気づくけど、CPUを多く使います\n"
+             "環境変数 WATCH_INTERVAL でも指定できます"
+    )
+
     # コマンドライン引数を解析（読み込む）
     args = parser.parse_args()
 
@@ -315,15 +712,20 @@ def main():
     # フォルダ監視の開始
     # ============================================================
 
+    # オブザーバー（フォルダを監視する係）を作成
+    # （ネットワーク上のフォルダならポーリングで監視する）
+    observer, polling = _make_observer(INPUT_DIR, args.poll_interval)
+
     # イベントハンドラー（ファイル追加を検知する係）を作成
+    # ポーリングで監視するときは on_closed が届かない
     event_handler = AudioFileHandler(
         model_name=args.model,
-        language=args.language
+        language=args.language,
+        batch_size=args.batch_size,
+        compute_type=args.compute_type,
+        close_events=SUPPORTS_CLOSE_EVENT and not polling
     )
 
-    # オブザーバー（フォルダを監視する係）を作成
-    observer = Observer()
-
     # どのフォルダを監視するか設定
     # recursive=False → サブフォルダは監視しない
     observer.schedule(event_handler, INPUT_DIR, recursive=False)
@@ -333,8 +735,8 @@ def main():
 
     try:
         # メインループ（ずっと動き続ける部分）
-        while not should_exit:
-            time.sleep(1)  # 1秒ごとにチェック
+        # 終了の合図が来るまで眠って待つ
+        _exit_event.wait()
 
     except KeyboardInterrupt:
         # Ctrl+C が押された場合
@@ -346,6 +748,21 @@ def main():
         observer.stop()      # 監視を停止
         observer.join()      # 監視スレッドの終了を待つ
 
+        # まだ始まっていない処理待ちのファイルは取り消す
+        while True:
+            try:
+                event_handler.job_queue.get_nowait()
+            except queue.Empty:
+                break
+
+        # ワーカースレッドに1つずつ終了の合図を送り、処理中のファイルが終わるまで待つ
+        # （途中で終わると、書きかけの結果ファイルが残ってしまう）
+        for _ in event_handler.workers:
+            event_handler.job_queue.put(None)
+        print("処理中のファイルがあれば、終わるまで待っています...")
+        for worker in event_handler.workers:
+            worker.join()
+
         print()
         print("=" * 70)
         print("👋 プログラムを終了しました")
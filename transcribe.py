@@ -6,9 +6,9 @@ M4A音声ファイルをWhisperで文字起こしするスクリプト
 音声ファイル（.m4a形式）を読み込んで、AIが自動的に文字に変換します。
 
 【特徴】
-- MacBook Pro M4で高速処理できるように最適化
+- faster-whisper（CTranslate2）で高速・省メモリに処理
 - 3時間以上の長時間音声にも対応
-- 10分ごとに分割して処理するため、メモリに優しい
+- 話している区間ごとに分割して処理するため、文の途中で切れにくい
 """
 
 # ============================================================
@@ -17,12 +17,25 @@ M4A音声ファイルをWhisperで文字起こしするスクリプト
 
 import os                          # ファイルやフォルダの操作に使う
 import sys                         # プログラムの終了などに使う
+import platform                    # CPUの種類（Apple Silicon かどうか）を調べる
 import argparse                    # コマンドライン引数（オプション）を扱う
+import threading                   # キャッシュを複数スレッドから安全に使うための鍵
+import json                        # キャッシュをファイルに保存する
 from pathlib import Path           # ファイルパスを扱いやすくする
 from datetime import datetime      # 日付と時刻を扱う
-import whisper                     # OpenAIのWhisper（音声認識AI）
-from pydub import AudioSegment     # 音声ファイルを分割・変換する
-import torch                       # AIの計算に使う（PyTorch）
+from contextlib import contextmanager  # with 文で使える関数を作る
+import numpy as np                 # 音声データを数値の配列として扱う
+import ctranslate2                 # faster-whisperの計算エンジン（GPUの確認に使う）
+from faster_whisper import WhisperModel, BatchedInferencePipeline, decode_audio  # 高速版のWhisper（音声認識AI）
+from faster_whisper.vad import VadOptions, get_speech_timestamps  # 音声区間検出（Silero VAD）
+import xxhash                      # ファイルの「指紋」を高速に計算する
+
+# Apple Silicon（M1〜M4）専用の高速版Whisper（MLX）
+# 入っていなければ使わない（pip install mlx-whisper で入れられる）
+try:
+    import mlx_whisper
+except ImportError:
+    mlx_whisper = None
 
 # ============================================================
 # 設定（定数）
@@ -30,9 +43,46 @@ import torch                       # AIの計算に使う（PyTorch）
 
 INPUT_DIR = "input"       # 音声ファイルを入れるフォルダ
 OUTPUT_DIR = "output"     # 文字起こし結果を保存するフォルダ
-CHUNK_LENGTH_MS = 10 * 60 * 1000  # 10分ごとに分割（1000ミリ秒 = 1秒）
-                                   # なぜ分割？→ 長い音声を一度に処理すると
-                                   #             メモリ（RAM）が足りなくなるため
+HEADER_SEPARATOR = f"\n{'='*60}\n\n"  # 結果ファイルのヘッダーと本文の区切り
+
+# 文字起こし結果のキャッシュ（同じ音声の結果を覚えておくファイル）
+# 中身: {"音声ファイルの指紋:モデル名:言語:精度": 結果テキストファイルのパス}
+# monitor.py と transcribe_auto.py のどちらで作った結果も、もう一方で使い回せる
+CACHE_FILE = Path(OUTPUT_DIR) / ".cache.json"
+
+CLIP_LENGTH_MS = 30 * 1000        # まとめて処理するときの1区間の最大の長さ（30秒、1000ミリ秒 = 1秒）
+                                   # Whisperは一度に30秒までしか処理できないため
+SAMPLE_RATE = 16000               # Whisperが使う音声のサンプリングレート（1秒 = 16000サンプル）
+DEFAULT_BATCH_SIZE = 16           # 一度にまとめてGPUに渡す区間の数
+                                   # 大きいほど速いが、GPUのメモリを多く使う
+
+# 同時にWhisperの計算を走らせてよい数（デバイスごと）
+# faster-whisper は同じモデルを複数スレッドから使える（num_workers の数まで同時に計算）
+# それより多く頼まれた分は CTranslate2 の中で順番待ちになる
+# GPUは1つの計算だけでは余裕があるので2つ、CPUは全コアを1つの計算で使うので1つ
+INFERENCE_SLOTS = {"cuda": 2, "cpu": 1}
+
+# モデルの数値の精度（デバイスごと）
+# int8 = 8ビット整数、float16 = 16ビット小数（どちらも32ビットより速くて省メモリ）
+COMPUTE_TYPES = {"cuda": "int8_float16", "cpu": "int8"}
+
+# CPUで計算するときに使うスレッドの数（= 物理コア数）
+# Intel・AMD のCPUはハイパースレッディングで1つのコアが2つに見えるので、論理コア数の半分にする
+# （2つに見える分まで使っても int8 の計算は速くならず、むしろ取り合いで遅くなることがある）
+# Apple Silicon（M1〜M4）にはハイパースレッディングがないので、全部のコアを使う
+if sys.platform == "darwin" and platform.machine() == "arm64":
+    CPU_THREADS = os.cpu_count() or 1
+else:
+    CPU_THREADS = max(1, (os.cpu_count() or 2) // 2)
+
+# mlx-whisper で使うモデルの置き場所（Hugging Face のリポジトリ名）
+# 例: "base" → "mlx-community/whisper-base-mlx"
+MLX_REPOS = {"large": "mlx-community/whisper-large-v3-mlx"}
+MLX_REPO_TEMPLATE = "mlx-community/whisper-{}-mlx"
+
+# 読み込んだWhisperモデルを覚えておく場所（キャッシュ）
+# 例: {("base", "cpu", "int8"): モデル}
+_MODEL_CACHE = {}
 
 
 def setup_directories():
@@ -65,193 +115,352 @@ def get_m4a_files():
     return sorted(m4a_files)                     # 名前順に並べて返す
 
 
-def convert_audio_to_chunks(audio_path, chunk_length_ms=CHUNK_LENGTH_MS):
+def load_audio_f32(audio_path):
     """
-    音声ファイルを小さな塊（チャンク）に分割する関数
+    音声ファイルを読み込んで、Whisperがそのまま使える形に変換する関数
 
-    【なぜ分割するの？】
-    長い音声を一度に処理すると、メモリ（RAM）が足りなくなる可能性があります。
-    例えば、3時間の音声を10分ずつに分割すれば、メモリを節約できます。
+    【やること】
+    1回だけデコードして、16kHz・モノラルの数値の並び
+    （numpyのfloat32配列）にします。Whisperはこの配列を直接受け取れるので、
+    wavファイルに書き出して読み直す必要がありません。
 
     【引数】
         audio_path: 音声ファイルのパス（例: input/meeting.m4a）
-        chunk_length_ms: 1つのチャンクの長さ（ミリ秒）
-                        デフォルトは10分 = 600,000ミリ秒
 
     【戻り値】
-        分割された音声データのリスト（例: [0-10分, 10-20分, 20-30分, ...]）
+        音声データ（numpyのfloat32配列、1秒 = 16000個の数値）
     """
     print(f"音声ファイルを読み込み中: {audio_path.name}")
-    # m4a形式の音声ファイルを読み込む
-    audio = AudioSegment.from_file(str(audio_path), format="m4a")
+    audio = decode_audio(str(audio_path), sampling_rate=SAMPLE_RATE)
 
     # 音声の長さを計算
-    duration_ms = len(audio)            # ミリ秒単位で長さを取得
-    duration_min = duration_ms / 1000 / 60  # 分に変換（÷1000で秒、÷60で分）
+    duration_min = len(audio) / SAMPLE_RATE / 60  # 秒に変換してから分に変換
     print(f"音声の長さ: {duration_min:.1f}分")
+    return audio
 
-    # ============================================================
-    # 音声をチャンク（塊）に分割
-    # ============================================================
-    chunks = []  # 分割した音声を入れるリスト
 
-    # 例: 30分の音声を10分ごとに分割
-    #     i = 0, 600000, 1200000 のように進む
-    for i in range(0, duration_ms, chunk_length_ms):
-        # i から i+chunk_length_ms までの部分を切り出す
-        # 例: audio[0:600000] → 最初の10分
-        chunk = audio[i:i + chunk_length_ms]
-        chunks.append(chunk)  # リストに追加
+def fixed_chunk_spans(n_samples, chunk_length_ms=CLIP_LENGTH_MS):
+    """
+    音声を決まった長さ（デフォルト30秒）ごとに区切ったときの区間を計算する関数
 
-    print(f"{len(chunks)}個のチャンクに分割しました")
-    return chunks
+    【いつ使うの？】
+    音声区間検出（VAD）が使えないときの予備です（segment_by_vad() から呼ばれる）。
+    話している場所が分からないので、Whisperが一度に処理できる30秒ずつ機械的に区切ります。
 
+    【引数】
+        n_samples: 音声データのサンプル数（len(audio)）
+        chunk_length_ms: 1つの区間の長さ（ミリ秒）
+                        デフォルトは30秒 = 30,000ミリ秒
 
-def transcribe_audio(audio_path, model_name="base", language="ja"):
+    【戻り値】
+        (開始サンプル, 終了サンプル) のリスト（例: [(0, 480000), (480000, 960000), ...]）
     """
-    音声ファイルを文字起こしする関数（このプログラムのメイン処理）
+    # 1つの区間に入るサンプル数（30秒 = 16000 × 30 = 480,000個）
+    samples_per_chunk = SAMPLE_RATE * chunk_length_ms // 1000
+
+    # 例: 90秒の音声を30秒ごとに区切る
+    #     i = 0, 480000, 960000 のように進む
+    return [
+        (i, min(i + samples_per_chunk, n_samples))
+        for i in range(0, n_samples, samples_per_chunk)
+    ]
 
-    【やること】
-    1. AIモデル（Whisper）を読み込む
-    2. 音声を10分ごとに分割
-    3. それぞれの塊を文字起こし
-    4. 全部つなげて返す
+
+def segment_by_vad(audio, sr=SAMPLE_RATE):
+    """
+    音声データを「話している部分」ごとに区切る関数
+
+    【なぜ区切り方を変えるの？】
+    10分ごとに機械的に切ると、言葉や文の途中で切れてしまい、
+    つなぎ目で文字が抜けたり重複したりします。また無音の部分まで
+    Whisperに処理させることになります。
+    無音（0.5秒以上）の部分で区切れば、文の途中で切れず、無音も処理しなくて済みます。
+    見つけた区間は、となり同士を最大30秒（Whisperが一度に処理する長さ）までまとめます。
 
     【引数】
-        audio_path: 音声ファイルのパス（例: input/lecture.m4a）
-        model_name: Whisperモデル名
-                   - tiny: 一番速いけど精度低め
-                   - base: バランス型（おすすめ）
-                   - small: やや高精度
-                   - medium: 高精度だけど遅い
-                   - large: 最高精度だけどとても遅い
-        language: 言語コード（ja=日本語、en=英語）
+        audio: load_audio_f32() で読み込んだ音声データ
+        sr: サンプリングレート（デフォルト: 16000）
 
     【戻り値】
-        文字起こし結果のテキスト（全文）
+        話している部分をまとめた (開始サンプル, 終了サンプル) のリスト
+        ※ VADが使えないときは、30秒ごとに機械的に区切る
     """
-    print(f"\n{'='*60}")
-    print(f"文字起こし開始: {audio_path.name}")
-    print(f"{'='*60}")
+    try:
+        # faster-whisper に入っている Silero VAD を使う（追加のダウンロード不要）
+        vad_options = VadOptions(
+            min_silence_duration_ms=500,  # 0.5秒以上の無音で区切る
+            max_speech_duration_s=30,     # 1つの区間は最大30秒
+        )
+        timestamps = get_speech_timestamps(audio, vad_options, sampling_rate=sr)
+    except Exception as e:
+        # VADが使えないときは30秒ごとに区切る
+        # （まとめて処理する仕組みは30秒より長い区間を扱えないため）
+        print(f"音声区間検出が使えないため、30秒ごとに分割します（{e}）")
+        return fixed_chunk_spans(len(audio))
 
-    # ============================================================
-    # どのデバイス（処理装置）で計算するか決める
-    # ============================================================
+    # ts["start"]〜ts["end"] はサンプル番号
+    spans = merge_spans([(ts["start"], ts["end"]) for ts in timestamps])
+    print(f"話している区間を{len(timestamps)}個見つけ、{len(spans)}個にまとめました")
+    return spans
+
+
+def merge_spans(spans, max_length_ms=CLIP_LENGTH_MS):
+    """
+    となり合う話している区間を、最大30秒になるまで1つにまとめる関数
+
+    【なぜまとめるの？】
+    Whisperは区間が短くても、足りない分を無音で埋めて30秒分の計算をします。
+    7秒の区間を1つずつ渡すと、4倍近く無駄な計算をすることになります。
+    また、前後の言葉も一緒に渡した方が、文のつながりが分かって精度が上がります。
+    （区間と区間のすき間の短い無音も、そのまま一緒に渡します）
 
-    # M4チップ（Apple Silicon）が使えるかチェック
-    if torch.backends.mps.is_available():
-        device = "mps"  # MPS = Metal Performance Shaders（Appleの高速計算）
-        print("M4チップ（MPS）を使用して高速処理します")
+    【引数】
+        spans: (開始サンプル, 終了サンプル) のリスト（時間の順）
+        max_length_ms: まとめた区間の最大の長さ（ミリ秒、デフォルト30秒）
+
+    【戻り値】
+        まとめた (開始サンプル, 終了サンプル) のリスト
+        例: [(0, 16000), (24000, 80000)] → [(0, 80000)]
+    """
+    max_samples = SAMPLE_RATE * max_length_ms // 1000  # 30秒 = 480,000サンプル
+
+    merged = []
+    for start, end in spans:
+        # 前の区間の最初から、この区間の終わりまでが30秒以内なら、つなげる
+        if merged and end - merged[-1][0] <= max_samples:
+            merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def pick_device():
+    """
+    どのデバイス（処理装置）で計算するか決める関数
+
+    【M4チップ（Apple Silicon）の場合】
+    mlx-whisper が入っていれば、MLX（Apple の計算ライブラリ）で
+    Mac の GPU を使います。入っていなければ CPU（int8）を使います。
+    （faster-whisper は MPS に対応していないため）
+
+    【戻り値】
+        "cuda"（NVIDIA GPU）、"mlx"（Apple Silicon の GPU）、"cpu" のどれか
+    """
     # NVIDIA GPUが使えるかチェック
-    elif torch.cuda.is_available():
-        device = "cuda"  # CUDA = NVIDIAのGPU計算
+    if ctranslate2.get_cuda_device_count() > 0:
         print("CUDA（GPU）を使用します")
-    # どちらも使えない場合はCPU
+        return "cuda"  # CUDA = NVIDIAのGPU計算
+    # Apple Silicon なら MLX（mlx-whisper は Apple Silicon にしか入らない）
+    elif mlx_whisper is not None:
+        print("MLX（Apple Silicon の GPU）を使用します")
+        return "mlx"
+    # 使えない場合はCPU
     else:
-        device = "cpu"
-        print("CPUを使用します")
+        print("CPU（int8）を使用します")
+        return "cpu"
 
-    # ============================================================
-    # Whisper（AI音声認識モデル）を読み込む
-    # ============================================================
 
-    print(f"Whisperモデル（{model_name}）を読み込み中...")
-    model = whisper.load_model(model_name, device=device)
+class MlxWhisperModel:
+    """
+    mlx-whisper を faster-whisper のモデルと同じように扱うためのクラス
 
-    # ============================================================
-    # 音声をチャンク（塊）に分割
-    # ============================================================
+    【なぜクラスにするの？】
+    mlx-whisper は「モデル」ではなく関数（mlx_whisper.transcribe）で使う。
+    どのモデルを使うか（リポジトリ名）を覚えておくために、小さな入れ物を作る。
+    """
 
-    chunks = convert_audio_to_chunks(audio_path)
+    def __init__(self, model_name):
+        """
+        引数:
+            model_name: Whisperモデル名（tiny, base, small, medium, large）
+        """
+        self.repo = MLX_REPOS.get(model_name, MLX_REPO_TEMPLATE.format(model_name))
+
+    def transcribe(self, audio, language):
+        """
+        音声データを文字起こしする関数
+
+        引数:
+            audio: 音声データ（numpyのfloat32配列）
+            language: 言語コード
+
+        戻り値:
+            文字起こし結果のテキスト
+        """
+        # モデルは mlx-whisper が1回だけ読み込んで覚えておいてくれる
+        result = mlx_whisper.transcribe(
+            audio,                        # 音声データ（numpy配列をそのまま渡す）
+            path_or_hf_repo=self.repo,    # 使うモデル
+            language=language,            # 言語（日本語なら "ja"）
+            verbose=None,                 # 途中経過を表示しない
+        )
+        return result["text"]
 
-    # ============================================================
-    # 一時ファイル用のフォルダを作成
-    # ============================================================
-    # なぜ必要？→ Whisperは音声ファイルを読み込む必要があるため、
-    #           メモリ上の音声データを一度ファイルとして保存する
 
-    temp_dir = Path("temp")               # tempフォルダ
-    temp_dir.mkdir(exist_ok=True)         # なければ作成
+def get_whisper_model(model_name="base", device="cpu", compute_type=None):
+    """
+    Whisperモデルを読み込む関数（2回目以降は読み込み済みのものを返す）
 
-    all_transcriptions = []  # 文字起こし結果を入れるリスト
+    【なぜ覚えておくの？】
+    モデルの読み込みには数秒〜数十秒かかり、大きなメモリも使います。
+    ファイルごとに読み込み直すのはもったいないので、1回だけ読み込んで使い回します。
 
-    # ============================================================
-    # 各チャンクを文字起こし（ここが一番重要！）
-    # ============================================================
+    【引数】
+        model_name: Whisperモデル名（tiny, base, small, medium, large）
+        device: 計算に使うデバイス（"cuda", "mlx", "cpu"）
+        compute_type: 数値の精度（"int8", "int8_float16", "float16", "float32"）
+                     None ならデバイスに合わせて自動で決める（COMPUTE_TYPES）
 
-    # enumerate() は番号付きで繰り返す
-    # 例: [(0, chunk1), (1, chunk2), (2, chunk3)]
-    for idx, chunk in enumerate(chunks):
-        print(f"\nチャンク {idx + 1}/{len(chunks)} を処理中...")
-
-        # ------------------------------------------------------------
-        # 1. チャンクを一時ファイルとして保存
-        # ------------------------------------------------------------
-        temp_file = temp_dir / f"temp_chunk_{idx}.wav"  # 一時ファイル名
-        chunk.export(str(temp_file), format="wav")      # wav形式で保存
-
-        # ------------------------------------------------------------
-        # 2. Whisperで文字起こし実行
-        # ------------------------------------------------------------
-        result = model.transcribe(
-            str(temp_file),      # 音声ファイルのパス
-            language=language,   # 言語（日本語なら "ja"）
-            verbose=False        # 詳細なログを表示しない
+    【戻り値】
+        読み込んだWhisperモデル
+    """
+    # MLX のときは mlx-whisper を使う（精度は mlx-whisper が決めるので compute_type は使わない）
+    if device == "mlx":
+        key = (model_name, device, None)
+        if key not in _MODEL_CACHE:
+            _MODEL_CACHE[key] = MlxWhisperModel(model_name)
+        return _MODEL_CACHE[key]
+
+    # 指定がなければ、デバイスに合った一番速い精度を使う
+    if compute_type is None:
+        compute_type = COMPUTE_TYPES[device]
+
+    key = (model_name, device, compute_type)
+    if key not in _MODEL_CACHE:
+        print(f"Whisperモデル（{model_name}, {compute_type}）を読み込み中...")
+        _MODEL_CACHE[key] = WhisperModel(
+            model_name,
+            device=device,
+            compute_type=compute_type,            # 数値の精度（int8など）
+            num_workers=INFERENCE_SLOTS[device],  # 同時に計算できる数
+            cpu_threads=CPU_THREADS,              # CPUで使うスレッド数（GPUのときは使われない）
         )
 
-        # 文字起こし結果を追加
-        # result["text"] に文字起こしされたテキストが入っている
-        all_transcriptions.append(result["text"])
+        # GPUは最初の1回の計算だけ準備（メモリの確保など）に時間がかかるので、
+        # 1秒の無音で試しに1回動かしておく（最初のファイルが遅くならないように）
+        if device == "cuda":
+            silence = np.zeros(SAMPLE_RATE, dtype=np.float32)
+            segments, info = _MODEL_CACHE[key].transcribe(silence, language="ja", beam_size=1)
+            list(segments)  # segments は取り出したときに計算されるので、ここで取り出す
+    return _MODEL_CACHE[key]
 
-        # ------------------------------------------------------------
-        # 3. 一時ファイルを削除（もう使わないので）
-        # ------------------------------------------------------------
-        temp_file.unlink()  # ファイルを削除
 
-        # ------------------------------------------------------------
-        # 4. 進捗を表示
-        # ------------------------------------------------------------
-        progress = (idx + 1) / len(chunks) * 100  # パーセントを計算
-        print(f"進捗: {progress:.1f}%")
+def transcribe_audio(audio_path, model, language="ja", batch_size=DEFAULT_BATCH_SIZE,
+                     output_file=None):
+    """
+    音声ファイルを文字起こしする関数（このプログラムのメイン処理）
+
+    【やること】
+    1. 音声を話している区間ごとに分割
+    2. 区間をまとめて（バッチで）文字起こし
+    3. 全部つなげて返す（output_file があれば、終わった区間から順に書き込む）
+
+    【引数】
+        audio_path: 音声ファイルのパス（例: input/lecture.m4a）
+        model: 読み込み済みのWhisperモデル（get_whisper_model() で作る）
+        language: 言語コード（ja=日本語、en=英語）
+        batch_size: 一度にまとめて計算する区間の数
+        output_file: 結果を書き込むファイル（open_transcription_file() で開く）
+                    渡すと全文をメモリにためずに、区間ごとにすぐ書き込む
+                    （書き込み中のファイルを開けば、途中までの結果を見られる）
+
+    【戻り値】
+        output_file があれば、書き込んだファイルのパス
+        なければ、文字起こし結果のテキスト（全文）
+    """
+    print(f"\n{'='*60}")
+    print(f"文字起こし開始: {audio_path.name}")
+    print(f"{'='*60}")
 
     # ============================================================
-    # 一時フォルダを削除（空になったので）
+    # 音声をチャンク（塊）に分割
     # ============================================================
 
-    try:
-        temp_dir.rmdir()  # 空のフォルダを削除
-    except:
-        pass  # エラーが出ても無視（残っててもOK）
+    audio = load_audio_f32(audio_path)
+    spans = segment_by_vad(audio)
+    n_chunks = len(spans)  # チャンクの数（進捗の表示に使う）
+
+    all_transcriptions = []  # 文字起こし結果を入れるリスト（output_file がないとき）
+    total_chars = 0          # 文字数（表示用）
 
     # ============================================================
-    # 全てのテキストを1つにつなげる
+    # 全チャンクをまとめて文字起こし（ここが一番重要！）
     # ============================================================
-    # 例: ["こんにちは", "今日は"] → "こんにちは\n今日は"
+    # 1つずつ順番に計算すると、GPUは計算の合間に待ってばかりになる
+    # BatchedInferencePipeline に区間（clip_timestamps）を全部渡すと、
+    # batch_size 個ずつまとめて1回の計算で処理してくれる
+    # 区間は秒で指定する（例: {"start": 0.0, "end": 30.0}）
+    # ※ faster-whisper 1.2 からは秒。サンプル番号のまま渡すと最初の30秒しか処理されない
+
+    if n_chunks == 0:
+        print("話している区間が見つかりませんでした")
+        texts = []
+    elif isinstance(model, MlxWhisperModel):
+        # mlx-whisper はまとめて計算できないので、（30秒以内にまとめた）区間ごとに
+        # 順番に文字起こしする
+        # （ジェネレーターなので、取り出すときに1つずつ計算される）
+        texts = (model.transcribe(audio[start:end], language) for start, end in spans)
+    else:
+        batched = BatchedInferencePipeline(model=model)
+        segments, info = batched.transcribe(
+            audio,                                  # 音声データ（numpy配列をそのまま渡す）
+            language=language,                      # 言語（日本語なら "ja"）
+            beam_size=1,                            # 候補を1つに絞って速くする
+            batch_size=min(n_chunks, batch_size),   # 一度にまとめる区間の数
+            clip_timestamps=[
+                {"start": start / SAMPLE_RATE, "end": end / SAMPLE_RATE}  # サンプル番号 → 秒
+                for start, end in spans
+            ],
+        )
+        # segments は「取り出すときに計算される」
+        # 結果は区間の順番通りに、1つの区間につき1つずつ出てくる
+        texts = (seg.text for seg in segments)
+
+    # 文字起こし結果を1つずつ受け取る
+    for idx, text in enumerate(texts):
+        total_chars += len(text)
+
+        if output_file is not None:
+            # すぐファイルに書き込む（flush でバッファからディスクへ送る）
+            output_file.write(text + "\n")
+            output_file.flush()
+        else:
+            all_transcriptions.append(text)
 
-    full_transcription = "\n".join(all_transcriptions)
+        # 進捗を表示
+        progress = min((idx + 1) / n_chunks * 100, 100.0)  # パーセントを計算
+        print(f"チャンク {idx + 1}/{n_chunks} 完了（進捗: {progress:.1f}%）")
 
     print(f"\n文字起こし完了!")
-    print(f"文字数: {len(full_transcription)}文字")
+    print(f"文字数: {total_chars}文字")
+
+    # ファイルに書き込んだ場合は、そのパスを返す
+    if output_file is not None:
+        return Path(output_file.name)
+
+    # ============================================================
+    # 全てのテキストを1つにつなげる
+    # ============================================================
+    # 例: ["こんにちは", "今日は"] → "こんにちは\n今日は"
 
-    return full_transcription
+    return "\n".join(all_transcriptions)
 
 
-def save_transcription(text, original_filename, output_dir=OUTPUT_DIR):
+def _transcription_header(original_filename, output_dir=OUTPUT_DIR):
     """
-    文字起こし結果をテキストファイルに保存する関数
+    保存先のファイル名と、ファイルの先頭に書くヘッダーを作る関数
 
     【やること】
     1. 元のファイル名から新しいファイル名を作る
     2. 日付と時刻を追加（同じ名前でも上書きされないように）
-    3. テキストファイルに保存
+    3. ヘッダー（元ファイル名・作成日時）の文字列を作る
 
     【引数】
-        text: 文字起こし結果のテキスト（全文）
         original_filename: 元の音声ファイル名（例: "meeting.m4a"）
         output_dir: 保存先フォルダ（デフォルト: "output"）
 
     【戻り値】
-        保存したファイルのパス（例: output/meeting_20250130_153000.txt）
+        (保存先のパス, ヘッダーの文字列)
     """
 
     # ============================================================
@@ -262,33 +471,217 @@ def save_transcription(text, original_filename, output_dir=OUTPUT_DIR):
     # 例: "meeting.m4a" → "meeting"
     base_name = Path(original_filename).stem
 
-    # 現在の日付と時刻を取得（例: "20250130_153000"）
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    # 現在の日付と時刻を1回だけ取得
+    # （ファイル名と作成日時で同じ時刻を使う。2回取ると秒や日付がずれることがある）
+    now = datetime.now()
 
     # ファイル名を組み立てる
     # 例: "meeting_20250130_153000.txt"
-    output_filename = f"{base_name}_{timestamp}.txt"
+    output_filename = f"{base_name}_{now:%Y%m%d_%H%M%S}.txt"
     output_path = Path(output_dir) / output_filename  # フルパス
 
     # ============================================================
-    # テキストファイルに保存
+    # ヘッダーを組み立てる（1回で書き込めるように1つの文字列にする）
     # ============================================================
 
+    header = (
+        f"# 文字起こし結果\n"
+        f"元ファイル: {original_filename}\n"
+        f"作成日時: {now:%Y-%m-%d %H:%M:%S}\n"
+        f"{HEADER_SEPARATOR}"
+    )
+
+    return output_path, header
+
+
+@contextmanager
+def open_transcription_file(original_filename, output_dir=OUTPUT_DIR):
+    """
+    文字起こし結果を書き込むファイルを開いて、ヘッダーを書き込む関数
+
+    【使い方】
+        with open_transcription_file("meeting.m4a") as f:
+            transcribe_audio(audio_path, model, output_file=f)
+
+    【失敗したときは】
+    with の中でエラーが起きたら（音声が壊れていて読めないなど）、ファイルを消します。
+    ヘッダーだけのファイルが残ると、文字起こしが終わった結果と見分けがつかないためです。
+
+    【引数】
+        original_filename: 元の音声ファイル名（例: "meeting.m4a"）
+        output_dir: 保存先フォルダ（デフォルト: "output"）
+
+    【戻り値】
+        開いたファイル（f.name がパス、例: output/meeting_20250130_153000.txt）
+    """
+    output_path, header = _transcription_header(original_filename, output_dir)
+
     # "w" = 書き込みモード、encoding="utf-8" = 日本語対応
-    with open(output_path, "w", encoding="utf-8") as f:
-        # ヘッダー情報を書き込む
-        f.write(f"# 文字起こし結果\n")
-        f.write(f"元ファイル: {original_filename}\n")
-        f.write(f"作成日時: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-        f.write(f"\n{'='*60}\n\n")
+    f = open(output_path, "w", encoding="utf-8")
+    try:
+        f.write(header)  # ヘッダー情報を書き込む
+        yield f
+    except BaseException:
+        # 途中で失敗したら、書きかけのファイルを閉じてから消す
+        f.close()
+        output_path.unlink(missing_ok=True)
+        raise
+    finally:
+        f.close()  # 成功したときも必ず閉じる（2回閉じても問題ない）
+
+
+def save_transcription(text, original_filename, output_dir=OUTPUT_DIR):
+    """
+    文字起こし結果（全文）をテキストファイルに保存する関数
+
+    【引数】
+        text: 文字起こし結果のテキスト（全文）
+        original_filename: 元の音声ファイル名（例: "meeting.m4a"）
+        output_dir: 保存先フォルダ（デフォルト: "output"）
 
-        # 文字起こし結果を書き込む
-        f.write(text)
+    【戻り値】
+        保存したファイルのパス（例: output/meeting_20250130_153000.txt）
+    """
+    output_path, header = _transcription_header(original_filename, output_dir)
+
+    # ヘッダーと文字起こし結果をまとめて1回で書き込む
+    output_path.write_text(header + text, encoding="utf-8")
 
     print(f"\n結果を保存しました: {output_path}")
     return output_path
 
 
+# ============================================================
+# 文字起こし結果のキャッシュ（同じ音声をもう一度文字起こししないため）
+# ============================================================
+
+def audio_fingerprint(file_path, block_size=1024 * 1024):
+    """
+    音声ファイルの「指紋」を計算する関数
+
+    【なぜ全部読まないの？】
+    大きなファイルを全部読むと時間がかかる。最初と最後の1MBとファイルサイズが
+    同じなら、ほぼ確実に同じ音声なので、それだけで指紋を作る。
+    計算には xxh3（CPUのSIMD命令を使う、SHA-256より10倍ほど速いハッシュ）を使う。
+
+    【引数】
+        file_path: 音声ファイルのパス
+        block_size: 最初と最後に読む大きさ（デフォルト1MB）
+
+    【戻り値】
+        指紋の文字列（例: "9f86d081884c7d65"）
+    """
+    h = xxhash.xxh3_64()
+    with open(file_path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        h.update(f.read(block_size))              # 最初の1MB
+        f.seek(max(size - block_size, 0))
+        h.update(f.read(block_size))              # 最後の1MB
+    h.update(str(size).encode())                  # ファイルサイズ
+    return h.hexdigest()
+
+
+class ResultCache:
+    """
+    同じ音声の文字起こし結果を覚えておくクラス（中身は CACHE_FILE に保存する）
+
+    【どうやって見分けるの？】
+    音声ファイルの指紋だけでなく、モデル・言語・精度も合わせてキーにする。
+    同じ音声でも設定が違えば結果も違うので、--model large で動かしたときに
+    前の base の結果を返さないようにするため。
+    """
+
+    def __init__(self, model_name, language, device, compute_type=None, path=CACHE_FILE):
+        """
+        引数:
+            model_name: Whisperモデル名（tiny, base, small, medium, large）
+            language: 言語コード
+            device: 計算に使うデバイス（"cuda", "mlx", "cpu"）
+            compute_type: 数値の精度（None ならデバイスの標準の精度）
+            path: キャッシュを保存するファイル
+        """
+        # MLX は mlx-whisper が精度を決めるので、"mlx" として区別する
+        if device == "mlx":
+            compute_type = "mlx"
+        elif compute_type is None:
+            compute_type = COMPUTE_TYPES[device]
+
+        self.settings = f"{model_name}:{language}:{compute_type}"  # キーの後ろにつける設定
+        self.path = Path(path)
+        self.lock = threading.Lock()  # 複数のスレッドが同時に書き込まないための鍵
+        self.entries = self._load()
+
+    def _load(self):
+        """
+        キャッシュをファイルから読み込む関数
+        （ファイルがない・壊れているときは空のキャッシュ）
+        """
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _key(self, fingerprint):
+        """
+        キャッシュのキーを作る関数（例: "9f86d081884c7d65:base:ja:int8"）
+        """
+        return f"{fingerprint}:{self.settings}"
+
+    def has(self, fingerprint):
+        """
+        同じ設定で文字起こしした結果があるか調べる関数（結果ファイルが残っているときだけ True）
+        """
+        cached_path = self.entries.get(self._key(fingerprint))
+        return cached_path is not None and Path(cached_path).exists()
+
+    def lookup(self, fingerprint):
+        """
+        キャッシュから文字起こし結果（本文）を探す関数
+
+        引数:
+            fingerprint: 音声ファイルの指紋（audio_fingerprint()）
+
+        戻り値:
+            見つかったら本文のテキスト、なければ None
+        """
+        cached_path = self.entries.get(self._key(fingerprint))
+        if cached_path is None:
+            return None
+
+        try:
+            content = Path(cached_path).read_text(encoding="utf-8")
+        except OSError:
+            return None  # 結果ファイルが消されていたら使えない
+
+        # ヘッダー（元ファイル名・作成日時）の後ろが本文
+        if HEADER_SEPARATOR not in content:
+            return None
+        return content.split(HEADER_SEPARATOR, 1)[1]
+
+    def store(self, fingerprint, output_path):
+        """
+        キャッシュに記録して、ファイルに保存する関数
+
+        【安全に保存するために】
+        一時ファイルに書いてディスクに確実に書き込んで（fsync）から置き換えるので、
+        途中で止まってもキャッシュファイルが壊れない。
+
+        引数:
+            fingerprint: 音声ファイルの指紋（audio_fingerprint()）
+            output_path: 文字起こし結果のファイルのパス
+        """
+        with self.lock:
+            self.entries[self._key(fingerprint)] = str(output_path)
+
+            tmp_path = self.path.with_suffix(".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.entries, f, ensure_ascii=False, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+
+
 def main():
     """
     メイン関数（プログラムが起動したら最初に実行される）
@@ -326,6 +719,23 @@ def main():
         help="言語コード (デフォルト: ja)"
     )
 
+    # --compute-type オプション（モデルの数値の精度）
+    parser.add_argument(
+        "--compute-type",
+        type=str,
+        default=None,
+        choices=["int8", "int8_float16", "float16", "float32"],
+        help="モデルの数値の精度 (デフォルト: CPUはint8、GPUはint8_float16)"
+    )
+
+    # --batch-size オプション（一度にまとめて計算する区間の数）
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=DEFAULT_BATCH_SIZE,
+        help=f"一度にまとめて計算する区間の数 (デフォルト: {DEFAULT_BATCH_SIZE})"
+    )
+
     # コマンドライン引数を解析（読み込む）
     args = parser.parse_args()
 
@@ -350,21 +760,30 @@ def main():
     for file in m4a_files:
         print(f"  - {file.name}")
 
+    # ============================================================
+    # Whisper（AI音声認識モデル）を読み込む
+    # ============================================================
+    # 全ファイルで同じモデルを使い回す（読み込みは1回だけ）
+
+    model = get_whisper_model(args.model, pick_device(), args.compute_type)
+
     # ============================================================
     # 各ファイルを文字起こし
     # ============================================================
 
     for audio_file in m4a_files:
         try:
-            # 文字起こし実行
-            transcription = transcribe_audio(
-                audio_file,
-                model_name=args.model,
-                language=args.language
-            )
-
-            # 結果をテキストファイルに保存
-            save_transcription(transcription, audio_file.name)
+            # 文字起こし実行（結果は区間ごとにファイルへ書き込まれる）
+            with open_transcription_file(audio_file.name) as f:
+                output_path = transcribe_audio(
+                    audio_file,
+                    model=model,
+                    language=args.language,
+                    batch_size=args.batch_size,
+                    output_file=f
+                )
+
+            print(f"\n結果を保存しました: {output_path}")
 
         except Exception as e:
             # エラーが起きても次のファイルに進む
@@ -4,12 +4,13 @@ Whisper自動文字起こしシステム
 
 【このプログラムの役割】
 inputフォルダを監視して、新しい.m4aファイルが追加されたら自動的に文字起こしします。
-MacBook Pro M4で高速に動作するように最適化されています。
+faster-whisper（CTranslate2）を使って、高速・省メモリに動作します。
+Apple Silicon の Mac では、mlx-whisper が入っていれば Mac の GPU（MLX）で動作します。
 
 【特徴】
 - フォルダ監視による完全自動化（Watchdog使用）
-- 3時間以上の長時間音声にも対応（10分ごとに分割処理）
-- 重複処理防止
+- 3時間以上の長時間音声にも対応（約10分ごとに、無音の位置で分割処理）
+- 重複処理防止（同じ音声がもう一度追加されたら、前回の結果を再利用）
 - ファイル転送完了待機（AirDropやコピー中の問題に対応）
 - 詳細なエラーハンドリング
 
@@ -28,23 +29,28 @@ import os                          # ファイル・フォルダ操作に使う
 import sys                         # プログラムの終了などに使う
 import time                        # 時間を扱う（待機など）
 import signal                      # Ctrl+Cを検知するために使う
+import queue                       # スレッド間でデータを受け渡す「待ち行列」
+import threading                   # 複数の処理を同時に動かす
 import argparse                    # コマンドライン引数を扱う
+from collections import deque      # 両端から出し入れできるリスト（先読みの管理に使う）
+from concurrent.futures import ThreadPoolExecutor  # 別のスレッドで処理を動かす
+from contextlib import contextmanager  # with 文で使える関数を作る
 from pathlib import Path           # ファイルパスを扱いやすくする
 from datetime import datetime      # 日付と時刻を扱う
 
-# Whisper（OpenAIの音声認識AI）
-import whisper
-
-# 音声ファイルの分割・変換
-from pydub import AudioSegment
-
-# AI計算用ライブラリ（PyTorch）
-import torch
+# Whisper（音声認識AI）の高速版（CTranslate2で動く faster-whisper）
+from faster_whisper import decode_audio
+from faster_whisper.vad import VadOptions, get_speech_timestamps  # 音声区間検出（Silero VAD）
 
 # フォルダ監視用ライブラリ（Watchdog）
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 
+# モデルの読み込み（デバイスの選び方・CPUのスレッド数・MLX）は transcribe.py と同じものを使う
+from transcribe import pick_device, get_whisper_model, MlxWhisperModel
+# 結果のキャッシュも monitor.py と同じもの（output/.cache.json）を使い、結果を使い回せるようにする
+from transcribe import HEADER_SEPARATOR, audio_fingerprint, ResultCache
+
 
 # ============================================================
 # 設定（定数）
@@ -55,6 +61,16 @@ OUTPUT_DIR = "output"                  # 結果を保存するフォルダ
 CHUNK_LENGTH_MS = 10 * 60 * 1000      # 10分ごとに分割（1000ミリ秒 = 1秒）
                                        # なぜ分割？→ 長い音声を一度に処理すると
                                        #             メモリ（RAM）が足りなくなるため
+SAMPLE_RATE = 16000                    # Whisperが使う音声のサンプリングレート（1秒 = 16000サンプル）
+CHUNK_SAMPLES = SAMPLE_RATE * CHUNK_LENGTH_MS // 1000  # 1つのチャンクに入るサンプル数
+                                                       # （10分 = 16000 × 600 = 9,600,000個）
+PREFETCH_CHUNKS = 2                    # 先に準備しておくチャンクの数
+CUT_WINDOW_S = 30                      # 区切りを探す範囲（10分ちょうどの位置から前後30秒）
+MIN_CUT_SILENCE_MS = 300               # 区切りに使う無音の最短の長さ（0.3秒）
+
+# ファイルの書き込み完了（on_closed）を検知できるかどうか
+# Linux の inotify は知らせてくれるが、macOS の FSEvents は知らせてくれない
+SUPPORTS_CLOSE_EVENT = sys.platform.startswith("linux")
 
 
 # ============================================================
@@ -74,191 +90,271 @@ def setup_directories():
     Path(OUTPUT_DIR).mkdir(exist_ok=True)  # outputフォルダを作成
 
 
-def convert_audio_to_chunks(audio_path, chunk_length_ms=CHUNK_LENGTH_MS):
+def load_audio(audio_path):
     """
-    音声ファイルを小さな塊（チャンク）に分割する関数
+    音声ファイルを読み込んで、Whisperがそのまま使える形に変換する関数
 
-    【なぜ分割するの？】
-    長い音声を一度に処理すると、メモリ（RAM）が足りなくなる可能性があります。
-    例えば、3時間の音声を10分ずつに分割すれば、メモリを節約できます。
+    【やること】
+    PyAV（faster-whisperに入っている）で、最初から16kHz・モノラルの
+    数値の並び（numpyのfloat32配列）としてデコードします。
+    44.1kHz・ステレオで読み込んでから変換するより、メモリも時間も少なくて済みます。
 
     【引数】
         audio_path: 音声ファイルのパス（例: input/meeting.m4a）
-        chunk_length_ms: 1つのチャンクの長さ（ミリ秒）
-                        デフォルトは10分 = 600,000ミリ秒
 
     【戻り値】
-        分割された音声データのリスト（例: [0-10分, 10-20分, 20-30分, ...]）
+        音声データ（numpyのfloat32配列、1秒 = 16000個の数値）
     """
     print(f"   音声ファイルを読み込み中: {audio_path.name}")
-    # m4a形式の音声ファイルを読み込む
-    audio = AudioSegment.from_file(str(audio_path), format="m4a")
+    audio = decode_audio(str(audio_path), sampling_rate=SAMPLE_RATE)
 
     # 音声の長さを計算
-    duration_ms = len(audio)            # ミリ秒単位で長さを取得
-    duration_min = duration_ms / 1000 / 60  # 分に変換（÷1000で秒、÷60で分）
+    duration_min = len(audio) / SAMPLE_RATE / 60  # 秒に変換（÷16000）してから分に変換（÷60）
     print(f"   音声の長さ: {duration_min:.1f}分")
+    return audio
 
-    # ============================================================
-    # 音声をチャンク（塊）に分割
-    # ============================================================
-    chunks = []  # 分割した音声を入れるリスト
 
-    # 例: 30分の音声を10分ごとに分割
-    #     i = 0, 600000, 1200000 のように進む
-    for i in range(0, duration_ms, chunk_length_ms):
-        # i から i+chunk_length_ms までの部分を切り出す
-        # 例: audio[0:600000] → 最初の10分
-        chunk = audio[i:i + chunk_length_ms]
-        chunks.append(chunk)  # リストに追加
+def find_chunk_cuts(audio):
+    """
+    音声をどこで区切るか（チャンクの境目）を決める関数
 
-    print(f"   {len(chunks)}個のチャンクに分割しました")
-    return chunks
+    【なぜちょうど10分で切らないの？】
+    10分ちょうどで機械的に切ると、言葉の途中で切れてしまい、
+    つなぎ目で文字が抜けたり、同じ言葉が2回出たりします。
+    そこで、10分の位置の前後30秒の中から「無音（0.3秒以上）」を探して、
+    そこで区切ります。
 
+    【やり方】
+    1. 音声全体で1回だけVAD（音声区間検出）を動かし、話している区間を調べる
+    2. 話している区間と区間のすき間＝無音
+    3. 10分、20分、30分…の位置ごとに、前後30秒以内で一番長い無音の真ん中で区切る
+       （無音が見つからなければ、今まで通りちょうどの位置で区切る）
 
-def transcribe_audio(audio_path, model_name="base", language="ja"):
+    【引数】
+        audio: load_audio() で読み込んだ音声データ
+
+    【戻り値】
+        各チャンクの終わりのサンプル番号のリスト（最後は音声の長さ）
+        例: [9598000, 19203000, 25000000]
     """
-    音声ファイルを文字起こしする関数（このプログラムのメイン処理）
+    n_samples = len(audio)
 
-    【やること】
-    1. AIモデル（Whisper）を読み込む
-    2. 音声を10分ごとに分割
-    3. それぞれの塊を文字起こし
-    4. 全部つなげて返す
+    # 本来の区切り位置（10分ごと）
+    targets = list(range(CHUNK_SAMPLES, n_samples, CHUNK_SAMPLES))
+    if not targets:
+        return [n_samples]  # 10分以下なら区切らない
+
+    try:
+        vad_options = VadOptions(
+            min_silence_duration_ms=MIN_CUT_SILENCE_MS,  # 0.3秒以上の無音を探す
+            speech_pad_ms=0,  # 話している区間を広げない（無音の長さをそのまま使う）
+        )
+        speech = get_speech_timestamps(audio, vad_options, sampling_rate=SAMPLE_RATE)
+    except Exception as e:
+        # VADが使えないときは10分ちょうどで区切る
+        print(f"   音声区間検出が使えないため、10分ごとに分割します（{e}）")
+        return targets + [n_samples]
+
+    # 話している区間と区間のすき間（無音）の (開始, 終了) のリスト
+    silences = [(prev["end"], cur["start"]) for prev, cur in zip(speech, speech[1:])]
+
+    window = CUT_WINDOW_S * SAMPLE_RATE  # 前後30秒をサンプル数に変換
+    cuts = []
+    for target in targets:
+        # 真ん中が前後30秒以内にある無音を集める
+        candidates = [
+            (start, end) for start, end in silences
+            if abs((start + end) // 2 - target) <= window
+        ]
+        if candidates:
+            # 一番長い無音を選ぶ（同じ長さなら、本来の位置に近い方）
+            start, end = max(
+                candidates,
+                key=lambda se: (se[1] - se[0], -abs((se[0] + se[1]) // 2 - target))
+            )
+            target = (start + end) // 2  # 無音の真ん中で区切る
+        cuts.append(target)
+
+    cuts.append(n_samples)  # 最後のチャンクは音声の終わりまで
+    return cuts
+
+
+def iter_audio_chunks(audio, cuts):
+    """
+    音声データを小さな塊（チャンク）に分割して、1つずつ返す関数（ジェネレーター）
+
+    【なぜ分割するの？】
+    長い音声を一度に処理すると、メモリ（RAM）が足りなくなる可能性があります。
+    例えば、3時間の音声を約10分ずつに分割すれば、メモリを節約できます。
+
+    【なぜジェネレーター？】
+    使う直前に1つずつ切り出すので、チャンクのリストを作っておく必要がありません。
+    numpyの切り出しはコピーを作らないので、切り出し自体もほぼ一瞬です。
 
     【引数】
-        audio_path: 音声ファイルのパス（例: input/lecture.m4a）
-        model_name: Whisperモデル名
-                   - tiny: 一番速いけど精度低め
-                   - base: バランス型（おすすめ）
-                   - small: やや高精度
-                   - medium: 高精度だけど遅い
-                   - large: 最高精度だけどとても遅い
-        language: 言語コード（ja=日本語、en=英語）
+        audio: load_audio() で読み込んだ音声データ
+        cuts: 各チャンクの終わりのサンプル番号のリスト（find_chunk_cuts() で作る）
 
     【戻り値】
-        文字起こし結果のテキスト（全文）
+        分割された音声データを1つずつ返す（例: 0-約10分, 約10-約20分, ...）
     """
+    start = 0
+    for end in cuts:
+        # start から end までの部分を切り出す
+        yield audio[start:end]
+        start = end
 
-    # ============================================================
-    # どのデバイス（処理装置）で計算するか決める
-    # ============================================================
 
-    # M4チップ（Apple Silicon）が使えるかチェック
-    if torch.backends.mps.is_available():
-        device = "mps"  # MPS = Metal Performance Shaders（Appleの高速計算）
-        print(f"   M4チップ（MPS）を使用して高速処理します")
-    # NVIDIA GPUが使えるかチェック
-    elif torch.cuda.is_available():
-        device = "cuda"  # CUDA = NVIDIAのGPU計算
-        print(f"   CUDA（GPU）を使用します")
-    # どちらも使えない場合はCPU
-    else:
-        device = "cpu"
-        print(f"   CPUを使用します")
+def transcribe_audio(audio_path, model, language="ja", audio=None, output_file=None):
+    """
+    音声ファイルを文字起こしする関数（このプログラムのメイン処理）
 
-    # ============================================================
-    # Whisper（AI音声認識モデル）を読み込む
-    # ============================================================
+    【やること】
+    1. 音声を約10分ごとに（無音の位置で）分割
+    2. それぞれの塊を文字起こし
+    3. 全部つなげて返す
 
-    print(f"   Whisperモデル（{model_name}）を読み込み中...")
-    model = whisper.load_model(model_name, device=device)
+    【引数】
+        audio_path: 音声ファイルのパス（例: input/lecture.m4a）
+        model: 読み込み済みのWhisperモデル（get_whisper_model() で作る）
+        language: 言語コード（ja=日本語、en=英語）
+        audio: 読み込み済みの音声データ（load_audio() の結果）
+               None ならここで読み込む
+        output_file: 結果を書き込むファイル（open_transcription_file() で開く）
+                    渡すと全文をメモリにためずに、チャンクごとにすぐ書き込む
+                    （書き込み中のファイルを開けば、途中までの結果を見られる）
+
+    【戻り値】
+        output_file があれば、書き込んだファイルのパス
+        なければ、文字起こし結果のテキスト（全文）
+    """
 
     # ============================================================
     # 音声をチャンク（塊）に分割
     # ============================================================
 
-    chunks = convert_audio_to_chunks(audio_path)
-
-    # ============================================================
-    # 一時ファイル用のフォルダを作成
-    # ============================================================
-    # なぜ必要？→ Whisperは音声ファイルを読み込む必要があるため、
-    #           メモリ上の音声データを一度ファイルとして保存する
+    # まだ読み込んでいなければ、ここで読み込む
+    if audio is None:
+        audio = load_audio(audio_path)
 
-    temp_dir = Path("temp")               # tempフォルダ
-    temp_dir.mkdir(exist_ok=True)         # なければ作成
+    # 区切る位置を先に決めておく（チャンクの数は進捗の表示に使う）
+    # 例: 25分の音声 → 約10分、約20分の無音で区切って3個
+    cuts = find_chunk_cuts(audio)
+    n_chunks = len(cuts)
+    print(f"   {n_chunks}個のチャンクに分割します")
 
-    all_transcriptions = []  # 文字起こし結果を入れるリスト
+    all_transcriptions = []  # 文字起こし結果を入れるリスト（output_file がないとき）
+    total_chars = 0          # 文字数（表示用）
 
     # ============================================================
     # 各チャンクを文字起こし（ここが一番重要！）
     # ============================================================
 
-    print()
-    # enumerate() は番号付きで繰り返す
-    # 例: [(0, chunk1), (1, chunk2), (2, chunk3)]
-    for idx, chunk in enumerate(chunks):
-        print(f"   チャンク {idx + 1}/{len(chunks)} を処理中...")
-
-        # ------------------------------------------------------------
-        # 1. チャンクを一時ファイルとして保存
-        # ------------------------------------------------------------
-        temp_file = temp_dir / f"temp_chunk_{idx}.wav"  # 一時ファイル名
-        chunk.export(str(temp_file), format="wav")      # wav形式で保存
-
-        # ------------------------------------------------------------
-        # 2. Whisperで文字起こし実行
-        # ------------------------------------------------------------
-        result = model.transcribe(
-            str(temp_file),      # 音声ファイルのパス
-            language=language,   # 言語（日本語なら "ja"）
-            verbose=False        # 詳細なログを表示しない
-        )
+    # model.transcribe() を呼ぶと、まず無音の検出（VAD）と特徴量（メルスペクトログラム）の
+    # 計算をCPUで行い、実際の文字起こし（デコード）は segments を取り出すときに行う
+    # そこで、今のチャンクを文字起こししている間に、次のチャンクの
+    # model.transcribe() を別のスレッドで呼んでおく（CPUとGPUを同時に働かせる）
 
-        # 文字起こし結果を追加
-        # result["text"] に文字起こしされたテキストが入っている
-        all_transcriptions.append(result["text"])
+    # mlx-whisper（Apple Silicon の GPU）は、準備と文字起こしを分けられないので、
+    # チャンクの文字起こしそのものを別のスレッドで先に進めておく
+    is_mlx = isinstance(model, MlxWhisperModel)
 
-        # ------------------------------------------------------------
-        # 3. 一時ファイルを削除（もう使わないので）
-        # ------------------------------------------------------------
-        temp_file.unlink()  # ファイルを削除
+    chunks = iter_audio_chunks(audio, cuts)
+    pending = deque()  # 準備中・準備済みのチャンク（古い順）
 
-        # ------------------------------------------------------------
-        # 4. 進捗を表示
-        # ------------------------------------------------------------
-        progress = (idx + 1) / len(chunks) * 100  # パーセントを計算
-        print(f"   進捗: {progress:.1f}%")
+    print()
+    with ThreadPoolExecutor(max_workers=1) as executor:
+
+        def prefetch_next():
+            """次のチャンクがあれば、準備を別のスレッドに頼む"""
+            chunk = next(chunks, None)
+            if chunk is None:
+                return
+            if is_mlx:
+                # mlx-whisper は文字起こし結果のテキストをそのまま返す
+                pending.append(executor.submit(model.transcribe, chunk, language))
+            else:
+                pending.append(executor.submit(
+                    model.transcribe,
+                    chunk,               # 音声データ（numpy配列をそのまま渡す）
+                    language=language,   # 言語（日本語なら "ja"）
+                    beam_size=1,         # 候補を1つに絞って速くする
+                    vad_filter=True,     # 無音の部分を飛ばす（Silero VAD）
+                    # 0.5秒以上の無音で区切って飛ばす
+                    # （初期設定の2秒だと、会話の短い間（ま）の無音まで処理してしまう）
+                    vad_parameters=dict(min_silence_duration_ms=500)
+                ))
+
+        # 最初に PREFETCH_CHUNKS 個の準備を頼んでおく
+        for _ in range(PREFETCH_CHUNKS):
+            prefetch_next()
+
+        idx = 0
+        while pending:
+            print(f"   チャンク {idx + 1}/{n_chunks} を処理中...")
+
+            # ------------------------------------------------------------
+            # 1. 準備ができたチャンクを受け取り、次のチャンクの準備を頼む
+            # ------------------------------------------------------------
+            result = pending.popleft().result()
+            prefetch_next()
+
+            # ------------------------------------------------------------
+            # 2. Whisperで文字起こし実行
+            # ------------------------------------------------------------
+            if is_mlx:
+                text = result  # mlx-whisper はもう文字起こしが終わっている
+            else:
+                # segments は「取り出すときに計算される」ので、ここでつなげる
+                # seg.text に文字起こしされたテキストが入っている
+                segments, info = result
+                text = "".join(seg.text for seg in segments)
+            total_chars += len(text)
+
+            if output_file is not None:
+                # すぐファイルに書き込む（flush でバッファからディスクへ送る）
+                output_file.write(text + "\n")
+                output_file.flush()
+            else:
+                all_transcriptions.append(text)
+
+            # ------------------------------------------------------------
+            # 3. 進捗を表示
+            # ------------------------------------------------------------
+            idx += 1
+            progress = idx / n_chunks * 100  # パーセントを計算
+            print(f"   進捗: {progress:.1f}%")
 
-    # ============================================================
-    # 一時フォルダを削除（空になったので）
-    # ============================================================
+    print(f"   文字起こし完了!")
+    print(f"   文字数: {total_chars}文字")
 
-    try:
-        temp_dir.rmdir()  # 空のフォルダを削除
-    except:
-        pass  # エラーが出ても無視（残っててもOK）
+    # ファイルに書き込んだ場合は、そのパスを返す
+    if output_file is not None:
+        return Path(output_file.name)
 
     # ============================================================
     # 全てのテキストを1つにつなげる
     # ============================================================
     # 例: ["こんにちは", "今日は"] → "こんにちは\n今日は"
 
-    full_transcription = "\n".join(all_transcriptions)
-
-    print(f"   文字起こし完了!")
-    print(f"   文字数: {len(full_transcription)}文字")
-
-    return full_transcription
+    return "\n".join(all_transcriptions)
 
 
-def save_transcription(text, original_filename, output_dir=OUTPUT_DIR):
+def _transcription_header(original_filename, output_dir=OUTPUT_DIR):
     """
-    文字起こし結果をテキストファイルに保存する関数
+    保存先のファイル名と、ファイルの先頭に書くヘッダーを作る関数
 
     【やること】
     1. 元のファイル名から新しいファイル名を作る
     2. 日付と時刻を追加（同じ名前でも上書きされないように）
-    3. テキストファイルに保存
+    3. ヘッダー（元ファイル名・作成日時）の文字列を作る
 
     【引数】
-        text: 文字起こし結果のテキスト（全文）
         original_filename: 元の音声ファイル名（例: "meeting.m4a"）
         output_dir: 保存先フォルダ（デフォルト: "output"）
 
     【戻り値】
-        保存したファイルのパス（例: output/meeting_20250130_153000.txt）
+        (保存先のパス, ヘッダーの文字列)
     """
 
     # ============================================================
@@ -269,28 +365,82 @@ def save_transcription(text, original_filename, output_dir=OUTPUT_DIR):
     # 例: "meeting.m4a" → "meeting"
     base_name = Path(original_filename).stem
 
-    # 現在の日付と時刻を取得（例: "20250130_153000"）
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    # 現在の日付と時刻を1回だけ取得
+    # （ファイル名と作成日時で同じ時刻を使う。2回取ると秒や日付がずれることがある）
+    now = datetime.now()
 
     # ファイル名を組み立てる
     # 例: "meeting_20250130_153000.txt"
-    output_filename = f"{base_name}_{timestamp}.txt"
+    output_filename = f"{base_name}_{now:%Y%m%d_%H%M%S}.txt"
     output_path = Path(output_dir) / output_filename  # フルパス
 
     # ============================================================
-    # テキストファイルに保存
+    # ヘッダーを組み立てる（1回で書き込めるように1つの文字列にする）
     # ============================================================
 
+    header = (
+        f"# 文字起こし結果\n"
+        f"元ファイル: {original_filename}\n"
+        f"作成日時: {now:%Y-%m-%d %H:%M:%S}\n"
+        f"{HEADER_SEPARATOR}"
+    )
+
+    return output_path, header
+
+
+@contextmanager
+def open_transcription_file(original_filename, output_dir=OUTPUT_DIR):
+    """
+    文字起こし結果を書き込むファイルを開いて、ヘッダーを書き込む関数
+
+    【使い方】
+        with open_transcription_file("meeting.m4a") as f:
+            transcribe_audio(audio_path, model, output_file=f)
+
+    【失敗したときは】
+    with の中でエラーが起きたら（音声が壊れていて読めないなど）、ファイルを消します。
+    ヘッダーだけのファイルが残ると、文字起こしが終わった結果と見分けがつかないためです。
+
+    【引数】
+        original_filename: 元の音声ファイル名（例: "meeting.m4a"）
+        output_dir: 保存先フォルダ（デフォルト: "output"）
+
+    【戻り値】
+        開いたファイル（f.name がパス、例: output/meeting_20250130_153000.txt）
+    """
+    output_path, header = _transcription_header(original_filename, output_dir)
+
     # "w" = 書き込みモード、encoding="utf-8" = 日本語対応
-    with open(output_path, "w", encoding="utf-8") as f:
-        # ヘッダー情報を書き込む
-        f.write(f"# 文字起こし結果\n")
-        f.write(f"元ファイル: {original_filename}\n")
-        f.write(f"作成日時: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-        f.write(f"\n{'='*60}\n\n")
+    f = open(output_path, "w", encoding="utf-8")
+    try:
+        f.write(header)  # ヘッダー情報を書き込む
+        yield f
+    except BaseException:
+        # 途中で失敗したら、書きかけのファイルを閉じてから消す
+        f.close()
+        output_path.unlink(missing_ok=True)
+        raise
+    finally:
+        f.close()  # 成功したときも必ず閉じる（2回閉じても問題ない）
+
+
+def save_transcription(text, original_filename, output_dir=OUTPUT_DIR):
+    """
+    文字起こし結果（全文）をテキストファイルに保存する関数
+
+    【引数】
+        text: 文字起こし結果のテキスト（全文）
+        original_filename: 元の音声ファイル名（例: "meeting.m4a"）
+        output_dir: 保存先フォルダ（デフォルト: "output"）
+
+    【戻り値】
+        保存したファイルのパス（例: output/meeting_20250130_153000.txt）
+    """
+    output_path, header = _transcription_header(original_filename, output_dir)
 
-        # 文字起こし結果を書き込む
-        f.write(text)
+    # ヘッダーと文字起こし結果をまとめて1回で書き込む
+    # encoding="utf-8" = 日本語対応
+    output_path.write_text(header + text, encoding="utf-8")
 
     return output_path
 
@@ -308,18 +458,46 @@ class AudioFileHandler(FileSystemEventHandler):
     このクラスは「新しいファイルが追加されたら文字起こしする」というレシピ。
     """
 
-    def __init__(self, model_name="base", language="ja"):
+    def __init__(self, model_name="base", language="ja", compute_type=None):
         """
         初期設定（このクラスを使い始めるときに最初に実行される）
 
         引数（材料）:
             model_name: Whisperのモデル名（精度と速度のバランス）
             language: 言語（日本語は "ja"）
+            compute_type: モデルの数値の精度（None なら自動）
         """
         super().__init__()  # 親クラスの初期化（おまじない）
         self.model_name = model_name    # モデル名を保存
         self.language = language        # 言語を保存
-        self.processing_files = set()   # 現在処理中のファイルを記録（重複防止）
+        self.processing_files = set()   # 処理待ち・処理中のファイルを記録（重複防止）
+        self.closed_files = set()       # 処理待ちの間に on_closed が届いたファイル
+        self.lock = threading.Lock()    # processing_files などを複数スレッドから安全に使うための鍵
+
+        # Whisperモデルはここで1回だけ読み込む（ファイルごとに読み込み直さない）
+        # NVIDIA GPU なら CUDA、Apple Silicon なら MLX（Mac の GPU）、それ以外は CPU を使う
+        device = pick_device()
+        self.model = get_whisper_model(model_name, device, compute_type)
+
+        # 同じ音声の文字起こし結果を覚えておくキャッシュ（前回の分も読み込む）
+        # 同じ音声でも、モデル・言語・精度が違えば別の結果として扱う
+        self.result_cache = ResultCache(model_name, language, device, compute_type)
+
+        # ============================================================
+        # 処理待ちの行列と、裏で動き続ける係（スレッド）を用意
+        # ============================================================
+        # 監視係（watchdog）はファイルを行列に入れるだけにして、すぐ次の監視に戻る
+        # 読み込み係: 行列からファイルを取り出して音声をデコードする
+        # 文字起こし係: デコード済みの音声を受け取ってWhisperで文字起こしする
+        # 2つに分けると、1つ目のファイルを文字起こししている間に
+        # 次のファイルの読み込みを進めておける
+        self.job_queue = queue.Queue()             # 処理待ちのファイル
+        self.audio_queue = queue.Queue(maxsize=1)  # 読み込み済みの音声（先読みは1つまで）
+        self.stopping = threading.Event()          # 終了の準備中かどうか
+        self.decode_thread = threading.Thread(target=self._decode_worker, daemon=True)
+        self.transcribe_thread = threading.Thread(target=self._transcribe_worker, daemon=True)
+        self.decode_thread.start()
+        self.transcribe_thread.start()
 
     def on_created(self, event):
         """
@@ -332,10 +510,62 @@ class AudioFileHandler(FileSystemEventHandler):
         引数:
             event: 何が起きたかの情報（ファイル名など）
         """
+        file_path = self._target_path(event)
+        if file_path is None:
+            return  # 処理しなくていいファイル
+
+        print(f"\n🔍 新しいファイルを検出: {file_path.name}")
+
+        # Linux ではコピーが終わると on_closed が呼ばれるので、そちらで処理する
+        # ただし、別フォルダから移動してきたファイルは最初から中身があり、
+        # on_closed が来ないので、サイズ確認の方法で処理する
+        if SUPPORTS_CLOSE_EVENT and self._get_file_size(file_path) == 0:
+            print("   ファイルのコピーが完了するのを待っています...")
+            return
+
+        # それ以外（macOS や中身があるファイル）は、完全にコピーされたかを読み込み係が確認する
+        # （ここで待つと監視係が止まり、待っている間の on_closed も届かなくなる）
+        # コピーの途中で中身がある場合もあるので、待っている間に on_closed が届いたら完了とする
+        self._enqueue(file_path, wait=True)
+
+    def on_closed(self, event):
+        """
+        ファイルの書き込みが終わって閉じられたときに自動的に呼ばれる関数
+
+        【なぜ便利？】
+        「閉じられた」＝「コピーが終わった」なので、待たずにすぐ処理を始められる。
+        （Linux の inotify が知らせてくれる。macOS では呼ばれない）
+
+        引数:
+            event: 何が起きたかの情報（ファイル名など）
+        """
+        file_path = self._target_path(event)
+        if file_path is None:
+            return  # 処理しなくていいファイル
+
+        # サイズ確認で待っている途中なら、「書き込み完了」を記録して、待つのをやめてもらう
+        with self.lock:
+            if str(file_path) in self.processing_files:
+                self.closed_files.add(str(file_path))
+                return
+
+        # 書き込みが終わっているので、待たずに処理待ちの行列に入れる
+        self._enqueue(file_path, wait=False)
+
+    def _target_path(self, event):
+        """
+        イベントのファイルが文字起こしの対象かどうか調べる関数
+
+        引数:
+            event: 何が起きたかの情報（ファイル名など）
+
+        戻り値:
+            対象のファイルならそのパス、対象でなければ None
+        """
 
         # フォルダは無視する（ファイルだけを処理したい）
         if event.is_directory:
-            return
+            return None
 
         # 追加されたファイルのパスを取得
         file_path = Path(event.src_path)
@@ -343,104 +573,218 @@ class AudioFileHandler(FileSystemEventHandler):
         # .m4aファイルかどうかチェック
         # （.suffixはファイルの拡張子を取得する。例: "audio.m4a" → ".m4a"）
         if file_path.suffix.lower() != ".m4a":
-            return  # .m4aでなければ何もしない
+            return None  # .m4aでなければ何もしない
 
-        # すでに処理中のファイルは無視する（二重処理を防ぐ）
-        if str(file_path) in self.processing_files:
-            return
+        return file_path
 
-        # ファイルが完全にコピーされるまで少し待つ
-        # （大きなファイルはコピーに時間がかかるため）
-        print(f"\n🔍 新しいファイルを検出: {file_path.name}")
-        print("   ファイルのコピーが完了するまで待機中...")
-        time.sleep(2)  # 2秒待つ
-
-        # ファイルが完全にコピーされたか確認
-        if not self._wait_for_file_ready(file_path):
-            print(f"⚠️  ファイルの準備ができませんでした: {file_path.name}")
-            return
-
-        # 文字起こしを開始
-        self._process_audio_file(file_path)
+    def _get_file_size(self, file_path):
+        """
+        ファイルサイズを取得する関数（取得できなければ -1 を返す）
+        """
+        try:
+            return file_path.stat().st_size
+        except OSError:
+            return -1
 
-    def _wait_for_file_ready(self, file_path, max_wait=30):
+    def _wait_for_file_ready(self, file_path, max_wait=30, interval=1.0):
         """
-        ファイルが完全にコピーされるまで待つ関数
+        ファイルが完全にコピーされるまで待つ関数（on_closed が届かないとき用）
 
         【なぜ必要？】
         大きなファイルは、inputフォルダにコピーするのに時間がかかる。
         コピー中に文字起こしを始めると失敗するので、完全にコピーされるまで待つ。
 
+        【どうやって確認するの？】
+        - 待っている間に on_closed が届いたら、その時点でコピー完了
+        - 読み込みモードで開いてサイズを確認する（Windowsではコピー中は開けないことがある）
+        - ファイルサイズが2秒間（1秒ごとに2回続けて）変わらなければ、コピー完了と判断
+          （コピーが一瞬止まっただけで、途中までのファイルを文字起こししないように）
+
         引数:
             file_path: チェックするファイルのパス
             max_wait: 最大で何秒待つか（デフォルト30秒）
+            interval: 何秒ごとにサイズを確認するか（デフォルト1秒）
 
         戻り値:
             True: ファイルの準備ができた
-            False: タイムアウト（時間切れ）
+            False: タイムアウト（時間切れ）、または終了の準備中
         """
         start_time = time.time()  # 開始時刻を記録
         last_size = -1            # 前回のファイルサイズ（最初は-1）
         stable_count = 0          # ファイルサイズが変わらなかった回数
 
-        while True:
-            # 時間切れチェック
-            if time.time() - start_time > max_wait:
-                return False  # 30秒経っても準備できなかったら諦める
-
-            # ファイルが存在するかチェック
-            if not file_path.exists():
-                time.sleep(0.5)  # 0.5秒待って再チェック
-                continue
+        while time.time() - start_time <= max_wait and not self.stopping.is_set():
+            # 待っている間に on_closed が届いたら、書き込みは終わっている
+            if str(file_path) in self.closed_files:
+                return True
 
             try:
-                # 現在のファイルサイズを取得
-                current_size = file_path.stat().st_size
+                # "rb" = 読み込みモード（読み取り専用のファイルでも開ける）
+                with open(file_path, "rb") as f:
+                    current_size = os.fstat(f.fileno()).st_size
 
-                # ファイルサイズが変わっていないかチェック
+                # サイズが2回続けて前回と同じなら、コピー完了と判断
                 if current_size == last_size:
-                    stable_count += 1  # 変わっていない → カウントアップ
-                    # 3回連続で同じサイズなら、コピー完了と判断
-                    if stable_count >= 3:
+                    stable_count += 1
+                    if stable_count >= 2:
                         return True
                 else:
-                    # サイズが変わった → まだコピー中
                     stable_count = 0
                     last_size = current_size
 
-                time.sleep(0.5)  # 0.5秒待って再チェック
+            except (PermissionError, FileNotFoundError):
+                # まだ書き込み中で開けない（Windows） or まだファイルができていない
+                stable_count = 0
+                last_size = -1
+
+            time.sleep(interval)  # 少し待って再チェック
+
+        return False  # 30秒経っても準備できなかった
 
+    def _enqueue(self, file_path, wait):
+        """
+        ファイルを処理待ちの行列に入れる関数
+
+        引数:
+            file_path: 文字起こしする音声ファイルのパス
+            wait: True なら、読み込む前にコピーの完了をサイズ確認で待つ
+        """
+        # 処理中リストに追加（行列に入っている間も二重に入れないように）
+        with self.lock:
+            if str(file_path) in self.processing_files:
+                return  # すでに処理待ち・処理中（二重処理を防ぐ）
+            self.processing_files.add(str(file_path))
+        self.job_queue.put((file_path, wait))
+
+    def _finish(self, file_path):
+        """
+        処理が終わった（または諦めた）ファイルを、処理中リストから外す関数
+        """
+        with self.lock:
+            self.processing_files.discard(str(file_path))
+            self.closed_files.discard(str(file_path))
+
+    def _decode_worker(self):
+        """
+        行列からファイルを取り出して、音声を読み込み続ける関数（読み込み係のスレッド）
+
+        【なぜ分けるの？】
+        音声の読み込み（デコード）はCPUの仕事、文字起こしは主にGPUの仕事。
+        別々のスレッドで動かすと、文字起こし中に次のファイルを読み込んでおける。
+        """
+        while True:
+            job = self.job_queue.get()  # ファイルが来るまで待つ
+
+            # None は「もう終わり」の合図 → 文字起こし係にも伝えて終了
+            if job is None:
+                self.audio_queue.put(None)
+                return
+
+            file_path, wait = job
+
+            # 終了の準備中なら、まだ始まっていないファイルは読み込まない
+            if self.stopping.is_set():
+                self._finish(file_path)
+                continue
+
+            # on_closed が届かないファイルは、コピーが終わるまで待つ
+            if wait:
+                print("   ファイルのコピーが完了するまで待機中...")
+                if not self._wait_for_file_ready(file_path):
+                    if file_path.exists() and not self.stopping.is_set():
+                        # まだコピー中なら、捨てずに行列の最後に並び直す
+                        # （この後に届くイベントがないので、ここで捨てると二度と処理されない）
+                        print(f"⏳ まだコピー中のようです。あとでもう一度確認します: {file_path.name}")
+                        self.job_queue.put((file_path, True))
+                    else:
+                        print(f"⚠️  ファイルの準備ができませんでした: {file_path.name}")
+                        self._finish(file_path)
+                    continue
+
+            try:
+                fingerprint = audio_fingerprint(file_path)
+
+                # 前に同じ音声を文字起こししていれば、読み込み（デコード）はいらない
+                if self.result_cache.has(fingerprint):
+                    audio = None
+                else:
+                    audio = load_audio(file_path)
             except Exception as e:
-                # エラーが起きたら0.5秒待って再チェック
-                time.sleep(0.5)
+                # 読み込めなかったファイルは飛ばす
+                print()
+                print(f"❌ 音声ファイルを読み込めませんでした: {file_path.name}")
+                print(f"エラー内容: {str(e)}")
+                self._finish(file_path)
                 continue
 
-    def _process_audio_file(self, file_path):
+            # 文字起こし係に渡す（前のファイルがまだ待っていれば、空くまで待つ）
+            self.audio_queue.put((file_path, audio, fingerprint))
+
+    def _transcribe_worker(self):
+        """
+        読み込み済みの音声を受け取って、文字起こしし続ける関数（文字起こし係のスレッド）
+        """
+        while True:
+            item = self.audio_queue.get()  # 音声が来るまで待つ
+
+            # None は「もう終わり」の合図
+            if item is None:
+                return
+
+            file_path, audio, fingerprint = item
+
+            # 終了の準備中なら、先に読み込んでおいただけのファイルは文字起こししない
+            if self.stopping.is_set():
+                self._finish(file_path)
+                del item, audio
+                continue
+
+            self._process_audio_file(file_path, audio, fingerprint)
+
+            # 次のファイルを待っている間、音声データを持ち続けないように手放す
+            del item, audio
+
+    def _process_audio_file(self, file_path, audio=None, fingerprint=None):
         """
         音声ファイルを文字起こしする関数
 
         引数:
             file_path: 文字起こしする音声ファイルのパス
+            audio: 読み込み済みの音声データ（None ならここで読み込む）
+            fingerprint: 音声ファイルの指紋（None ならここで計算する）
         """
-        # 処理中リストに追加（二重処理を防ぐ）
-        self.processing_files.add(str(file_path))
-
         try:
             print()
             print("=" * 60)
             print(f"処理開始: {file_path.name}")
             print("=" * 60)
 
-            # 文字起こし実行
-            print("🎤 文字起こし中... （数分かかる場合があります）")
-            transcription = transcribe_audio(
-                file_path,
-                model_name=self.model_name,
-                language=self.language
-            )
-
-            # 結果をテキストファイルに保存
-            output_path = save_transcription(transcription, file_path.name)
+            if fingerprint is None:
+                fingerprint = audio_fingerprint(file_path)
+
+            # 前に同じ音声を同じ設定で文字起こししていれば、その結果をそのまま使う
+            transcription = self.result_cache.lookup(fingerprint)
+
+            if transcription is not None:
+                print("♻️  同じ音声の文字起こし結果があるので、再利用します")
+
+                # 結果をテキストファイルに保存
+                output_path = save_transcription(transcription, file_path.name)
+            else:
+                # 文字起こし実行（結果はチャンクごとにファイルへ書き込まれる）
+                # 書き込み中の .txt を開けば、途中までの結果を見られる
+                print("🎤 文字起こし中... （数分かかる場合があります）")
+                with open_transcription_file(file_path.name) as f:
+                    output_path = transcribe_audio(
+                        file_path,
+                        model=self.model,
+                        language=self.language,
+                        audio=audio,
+                        output_file=f
+                    )
+
+            # 次に同じ音声が来たときのために、キャッシュに記録
+            self.result_cache.store(fingerprint, output_path)
 
             print()
             print(f"✅ 完了: {output_path.name}")
@@ -459,7 +803,7 @@ class AudioFileHandler(FileSystemEventHandler):
         finally:
             # 処理が終わったら処理中リストから削除
             # （finally は、エラーが起きても必ず実行される）
-            self.processing_files.discard(str(file_path))
+            self._finish(file_path)
 
 
 # ============================================================
@@ -540,6 +884,18 @@ def main():
              "など"
     )
 
+    # --compute-type オプション（モデルの数値の精度）
+    parser.add_argument(
+        "--compute-type",
+        type=str,
+        default=None,
+        choices=["int8", "int8_float16", "float16", "float32"],
+        help="モデルの数値の精度 (デフォルト: CPUはint8、GPUはint8_float16)\n"
+             "int8: 一番速くて省メモリ\n"
+             "float16: GPU向け、int8よりわずかに高精度\n"
+             "float32: 一番正確だけど遅い"
+    )
+
     # コマンドライン引数を解析（読み込む）
     args = parser.parse_args()
 
@@ -583,7 +939,8 @@ def main():
     # イベントハンドラー（ファイル追加を検知する係）を作成
     event_handler = AudioFileHandler(
         model_name=args.model,
-        language=args.language
+        language=args.language,
+        compute_type=args.compute_type
     )
 
     # オブザーバー（フォルダを監視する係）を作成
@@ -613,6 +970,15 @@ def main():
         observer.stop()      # 監視を停止
         observer.join()      # 監視スレッドの終了を待つ
 
+        # 裏で動いている係に「もう終わり」の合図を送り、
+        # 文字起こし中のファイルが終わるまで待つ
+        # （途中で終わると、書きかけの結果ファイルが残ってしまう）
+        event_handler.stopping.set()
+        event_handler.job_queue.put(None)
+        print("処理中のファイルがあれば、終わるまで待っています...")
+        event_handler.decode_thread.join()
+        event_handler.transcribe_thread.join()
+
         print()
         print("=" * 70)
         print("👋 プログラムを終了しました")